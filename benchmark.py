@@ -0,0 +1,163 @@
+""" Run performance benchmarks """
+import os
+import tempfile
+from sqlite3 import connect
+from json import loads
+from time import perf_counter
+from statistics import mean, median
+from requests_cache import CachedSession
+from bs4 import BeautifulSoup, FeatureNotFound
+from document import SNIPPET_CLASSES, STAT_IDS, SerpExtractor
+from dispatch import read_frame
+from capture import Playback, PlaybackSocket, load_captures
+import bot
+from utils import Colours
+from cache import Cache
+from manifest import Manifest
+from segment import SEGMENT_EXTENSION
+
+
+def report_rate(name, count, seconds, baseline=None):
+    """ Print items per second """
+    line = '%-12s %6s items  %10.0f/s' % (name, count, count / seconds)
+    if baseline:
+        line += '  %5.1fx faster' % (baseline / seconds)
+    print(Colours.BOLD.value + line + Colours.ENDC.value if baseline is None else line)
+
+
+def decode_frame(message):
+    """ Decode every frame, as the bot did before frames were filtered by type """
+    data_start = message.find('{')
+    if data_start < 0:
+        return None, None
+    data = loads(message[data_start:])
+    return data.get('type'), data
+
+
+def report(name, timings, baseline=None):
+    """ Print per-item timings in milliseconds """
+    line = '%-12s %6s items  mean %8.2fms  median %8.2fms' % (
+        name, len(timings), mean(timings) * 1000, median(timings) * 1000
+    )
+    if baseline:
+        line += '  %5.1fx faster' % (mean(baseline) / mean(timings))
+    print(Colours.BOLD.value + line + Colours.ENDC.value if baseline is None else line)
+
+
+class Benchmark(object):
+    """ Benchmarks over the cached games archive """
+
+    @staticmethod
+    def cached_pages():
+        """ Load the HTML of every cached search page """
+        session = CachedSession('games/db/cache', allowable_codes=(200, 302, 304))
+        return [response.text for (response, _) in session.cache.responses.values()]
+
+    def parse(self):
+        """ Compare parse time per page across parser backends """
+        pages = self.cached_pages()
+        if not pages:
+            exit('Error: No cached pages found. Please run cache import_sql.')
+        baseline = None
+        for parser in ['html5lib', 'lxml', 'html.parser']:
+            try:
+                BeautifulSoup('', parser)
+            except FeatureNotFound:
+                print('%s is not installed. Please run pipenv install --dev.' % parser)
+                continue
+            timings = []
+            for text in pages:
+                start = perf_counter()
+                BeautifulSoup(text, parser)
+                timings.append(perf_counter() - start)
+            report(parser, timings, baseline)
+            baseline = baseline or timings
+
+    def extract(self):
+        """ Compare the streaming extractor with BeautifulSoup and check their output matches """
+        pages = self.cached_pages()
+        if not pages:
+            exit('Error: No cached pages found. Please run cache import_sql.')
+        (soup_timings, extract_timings, count_timings, mismatches) = ([], [], [], 0)
+        for text in pages:
+            start = perf_counter()
+            document = BeautifulSoup(text, 'html5lib')
+            results = ''.join(' ' + element.text for name in SNIPPET_CLASSES
+                              for element in document.find_all(class_=name))
+            stats = {stat_id: document.find(id=stat_id).text for stat_id in STAT_IDS if document.find(id=stat_id)}
+            soup_timings.append(perf_counter() - start)
+
+            start = perf_counter()
+            serp = SerpExtractor().extract(text)
+            extract_timings.append(perf_counter() - start)
+
+            start = perf_counter()
+            SerpExtractor(STAT_IDS).extract(text)
+            count_timings.append(perf_counter() - start)
+
+            if serp.results != results or serp.stats != stats:
+                mismatches += 1
+        report('html5lib', soup_timings)
+        report('extract', extract_timings, soup_timings)
+        report('stats only', count_timings, soup_timings)
+        print('%s/%s pages differ from BeautifulSoup output' % (mismatches, len(pages)))
+
+    @staticmethod
+    def frames():
+        """ Compare frames per second through the bot's message handler when decoding every frame and when
+        only decoding handled frames """
+        frames = [message for (_, message) in load_captures()]
+        if not frames:
+            exit('Error: No captured frames found in games/captures. Please run bot --capture.')
+        baseline = None
+        for name, reader in [('decode all', decode_frame), ('read_frame', read_frame)]:
+            player = Playback(bot.HqTriviaBot(), [])
+            player.prepare()
+            web_socket = PlaybackSocket()
+            bot.read_frame = reader
+            try:
+                start = perf_counter()
+                for message in frames:
+                    player.bot.on_message(web_socket, message)
+                elapsed = perf_counter() - start
+            finally:
+                bot.read_frame = read_frame
+            player.finish()
+            report_rate(name, len(frames), elapsed, baseline)
+            baseline = baseline or elapsed
+
+    @staticmethod
+    def export():
+        """ Compare export time, size on disk and import time of SQL dumps and compressed segments """
+        manifest = Manifest()
+        shows = manifest.games()
+        manifest.close()
+        if not shows:
+            exit('Error: No games in the cache manifest. Please run cache prune.')
+        with tempfile.TemporaryDirectory(prefix='export-') as directory:
+            (sql_dir, segment_dir) = (os.path.join(directory, 'sql'), os.path.join(directory, 'segment'))
+            os.makedirs(sql_dir)
+            os.makedirs(segment_dir)
+            (sql_timings, segment_timings) = ([], [])
+            for show_id in shows:
+                start = perf_counter()
+                Cache.export_sql(show_id, os.path.join(sql_dir, '%s.sql' % show_id))
+                sql_timings.append(perf_counter() - start)
+            conn = connect('games/db/cache.sqlite')
+            conn.execute('begin')
+            for show_id in shows:
+                start = perf_counter()
+                Cache.export_segment(conn, show_id, os.path.join(segment_dir, show_id + SEGMENT_EXTENSION))
+                segment_timings.append(perf_counter() - start)
+            conn.close()
+            report('export sql', sql_timings)
+            report('segment', segment_timings, sql_timings)
+
+            import_timings = {}
+            for name, export_dir in [('sql', sql_dir), ('segment', segment_dir)]:
+                size = sum(os.path.getsize(os.path.join(export_dir, filename)) for filename in os.listdir(export_dir))
+                start = perf_counter()
+                Cache.import_sql(os.path.join(directory, '%s.sqlite' % name), export_dir)
+                import_timings[name] = perf_counter() - start
+                print('%-12s %10.1fMB on disk  import %8.2fs' % (name, size / 1e6, import_timings[name]))
+            print('Segments import %.1fx faster' % (import_timings['sql'] / import_timings['segment']))
@@ -1,20 +1,24 @@
 """ Bot module where main game actions are performed """
+import os
 import webbrowser
-from os import path
-from time import sleep
+from time import sleep, monotonic
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
 from datetime import datetime
 from configparser import ConfigParser
-from json import loads, dump, JSONDecodeError
+from json import JSONDecodeError
 from pytz import utc
 from dateutil import parser
 from requests import get
 from requests.exceptions import RequestException
-from requests_cache import CachedSession
-from requests_futures.sessions import FuturesSession
 from websocket import WebSocketApp, WebSocketException, WebSocketTimeoutException
-from solvers import GoogleAnswerWordsSolver, GoogleResultsCountSolver
+from solvers import BaseSolver, GoogleAnswerWordsSolver, GoogleResultsCountSolver, RateLimited
 from utils import Colours
 from question import Question
+from store import GameStore
+from session import SearchSession, RequestRegistry, iter_completed
+from dispatch import HIDDEN_TYPES, Dispatcher, read_frame
+from message_log import MessageLog
+from features import FeatureCache
 
 
 class HqTriviaBot(object):
@@ -26,11 +30,21 @@ class HqTriviaBot(object):
         self.config = ConfigParser()
         self.config.read('config.ini')
         self.broadcast_ended = False
+        self.rate_limited = False
         self.current_game = ''
+        self.store = None
+        self.games_dir = './games/json'
+        self.open_browser = True
+        self.capture = None
+        self.features = None
         self.solvers = [
             GoogleAnswerWordsSolver(),
             GoogleResultsCountSolver()
         ]
+        self.deadline = self.config.getfloat('Bot', 'deadline', fallback=7.0)
+        self.session = SearchSession(max_workers=10, timeout=self.deadline)
+        self.dispatcher = Dispatcher()
+        self.message_log = None
         self.next_show_time = None
         self.next_show_prize = None
         self.headers = {
@@ -54,7 +68,10 @@ class HqTriviaBot(object):
             initial_json = resp.json()
         except JSONDecodeError:
             return None
+        return self.parse_show(initial_json)
 
+    def parse_show(self, initial_json):
+        """ Get broadcast socket URL and next show details from a shows response """
         # Get next show time and prize
         self.next_show_time = initial_json.get('nextShowTime')
         self.next_show_prize = initial_json.get('nextShowPrize')
@@ -68,53 +85,193 @@ class HqTriviaBot(object):
 
     def game_status(self, data):
         """ status of the game """
-        self.current_game = '%s-game-%s' % (data.get('ts')[:10], data.get('showId'))
-
-        # Create new save game file if not found
-        if not path.isfile('./games/json/%s.json' % self.current_game):
-            with open('./games/json/%s.json' % self.current_game, 'w') as file:
-                dump({
-                    'showId': data.get('showId'),
-                    'ts': data.get('ts'),
-                    'prize': data.get('prize'),
-                    'numCorrect': 0,
-                    'questionCount': data.get('questionCount'),
-                    'questions': [],
-                }, file, ensure_ascii=False, sort_keys=True, indent=4)
-
-    def prediction_time(self, question):
-        """ Predict a question objects answer using Solver instances """
-        print('\n\n\n------------ QUESTION %s | %s ------------' %
-              (question.number, question.category))
-        print('%s\n\n------------ ANSWERS ------------\n%s\n------------------------' %
-              ((Colours.BOLD.value + question.text + Colours.ENDC.value), question.answers))
+        self.create_game(data)
+        self.warm_up()
 
-        # Create session and open browser
-        if not question.is_replay:
-            session = FuturesSession(max_workers=10)
-            webbrowser.open('https://www.google.co.uk/search?pws=0&q=' + question.text)
-        else:
-            session = CachedSession('games/db/cache', allowable_codes=(200, 302, 304))
+    def create_game(self, data):
+        """ Set the current game and open its store, creating the save game file if not found """
+        self.rotate_game(data)
+        self.open_store(data)
+
+    @staticmethod
+    def game_name(data):
+        """ Name of the game a gameStatus message belongs to """
+        return '%s-game-%s' % (data.get('ts')[:10], data.get('showId'))
+
+    def rotate_game(self, data):
+        """ Set the current game and start its message log segments, without waiting on file I/O """
+        self.current_game = self.game_name(data)
+        if self.message_log is not None:
+            self.message_log.rotate(self.current_game)
+        if self.capture is not None:
+            self.capture.rotate(self.current_game)
+
+    def open_store(self, data):
+        """ Open the store of a game, writing the previous game first if it is a different one """
+        game = self.game_name(data)
+        game_path = os.path.join(self.games_dir, '%s.json' % game)
+        if self.store is None or self.store.path != game_path:
+            self.end_game()
+            self.store = GameStore.open(game_path, data, os.path.join(
+                os.path.dirname(self.games_dir), 'journal', '%s.jsonl' % game
+            ))
+
+    def end_game(self):
+        """ Write the current game and stop its store """
+        if self.store is not None:
+            self.store.close()
+            if self.message_log is not None:
+                print('Message log: %s lines flushed, %s dropped' % (self.message_log.flushed,
+                                                                     self.message_log.dropped))
 
-        # Run solvers
-        responses = {}
-        prediction = None
+    def shutdown(self):
+        """ Stop handling messages, write the current game and close the message logs """
+        self.dispatcher.shutdown()
+        self.end_game()
+        if self.message_log is not None:
+            self.message_log.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def open_log(self, directory='./games/logs'):
+        """ Start the message log when a socket opens, closing the log it replaces """
+        if self.message_log is not None:
+            self.message_log.close()
+        self.message_log = MessageLog(directory=directory)
+
+    def warm_up(self):
+        """ Open connections to search services before the first question """
+        (handshakes, setup_time) = self.session.stats.snapshot()
+        warmed = self.session.warm_up(solver.service_url for solver in self.solvers)
+        (total_handshakes, total_setup_time) = self.session.stats.snapshot()
+        print('Warmed %s connections (%s handshakes, %.0fms setup)' % (
+            warmed, total_handshakes - handshakes, (total_setup_time - setup_time) * 1000
+        ))
+
+    @staticmethod
+    def update_confidence(question_text, matches, solvers):
+        """ Combine matches from solvers into a prediction and confidence """
         confidence = {'A': 0, 'B': 0, 'C': 0}
+        for solver in solvers:
+            confidence = solver.compute_confidence(matches[solver], confidence)
+        return BaseSolver.choose_answer(question_text, confidence), confidence
+
+    @staticmethod
+    def cancel_requests(requests):
+        """ Cancel requests that have not been sent yet """
+        for request in requests:
+            if isinstance(request, Future):
+                request.cancel()
+
+    def prediction_time(self, question, received=None, cancelled=None):
+        """ Predict a question objects answer using Solver instances. Live questions are
+        predicted within the deadline from when the question was received, and abandoned
+        if the cancelled future completes first """
+        self.show_question(question)
+
+        # Use pooled session and open browser, or read solver features of cached pages for replays
+        if not question.is_replay:
+            (handshakes, setup_time) = self.session.stats.snapshot()
+            if self.open_browser:
+                webbrowser.open('https://www.google.co.uk/search?pws=0&q=' + question.text)
+        elif self.features is None:
+            self.features = FeatureCache()
+
+        # Fetch every unique solver URL once and score responses as they arrive
+        registry = RequestRegistry(self.session)
+        requests = {}
+        remaining = {}
+        solver_urls = {}
+        matches = {solver: {'A': 0, 'B': 0, 'C': 0} for solver in self.solvers}
+        contributed = []
+        failed = set()
         for solver in self.solvers:
-            responses[solver] = solver.fetch_responses(
-                solver.build_urls(question.text, question.answers), session
-            )
-        for solver, responses in responses.items():
-            (prediction, confidence) = solver.run(
-                question.text, question.answers, responses, confidence
-            )
+            urls = solver_urls[solver] = solver.build_urls(question.text, question.answers)
+            remaining[solver] = len(urls)
+            # Replays reuse the matches of solvers that have not changed since they last saw these URLs
+            if question.is_replay:
+                cached = self.features.get_matches(solver, urls, question.answers)
+                if cached is not None:
+                    print('\n%s: %s (cached)' % (solver.name, cached))
+                    (matches[solver], remaining[solver]) = (cached, 0)
+                    contributed.append(solver)
+                    continue
+            for answer_key, url in urls.items():
+                request = self.features.get(solver, url) if question.is_replay else registry.get(url)
+                requests.setdefault(request, []).append((solver, answer_key))
+        if cancelled is not None and any(remaining.values()):
+            requests[cancelled] = None
+        prediction = 'A'
+        confidence = {'A': 0, 'B': 0, 'C': 0}
+        timeout = None if question.is_replay else max((received or monotonic()) + self.deadline - monotonic(), 0)
+        try:
+            for response, waiting in iter_completed(requests, timeout):
+                if waiting is None:
+                    self.cancel_requests(requests)
+                    print('\nPrediction for question %s cancelled.' % question.number)
+                    return None
+                # Solvers missing a response are left out of the prediction
+                if isinstance(response, Exception):
+                    print('\nERROR: %s' % response)
+                    failed.update(solver for solver, _ in waiting)
+                for solver, answer_key in waiting:
+                    if solver in failed:
+                        remaining[solver] = 0
+                        continue
+                    print('\n%s (%s): ' % (solver.name, answer_key))
+                    try:
+                        matches[solver] = solver.score(response, answer_key, question.answers, matches[solver])
+                    except RateLimited:
+                        print('\nERROR: Google rate limiting detected. Predicting without %s.' % solver.name)
+                        self.rate_limited = True
+                        failed.add(solver)
+                        remaining[solver] = 0
+                        continue
+                    remaining[solver] -= 1
+                    if not remaining[solver]:
+                        contributed.append(solver)
+                        if question.is_replay:
+                            self.features.put_matches(solver, solver_urls[solver], question.answers,
+                                                      matches[solver])
+                (prediction, confidence) = self.update_confidence(question.text, matches, contributed)
+                if not any(remaining.values()):
+                    break
+        except FuturesTimeoutError:
+            self.cancel_requests(requests)
+            print('\nDeadline of %ss reached. Predicting with %s/%s solvers.' % (
+                self.deadline, len(contributed), len(self.solvers)
+            ))
+        print('\nFetched %s URLs (%s shared)' % (len(registry.requests), registry.shared))
+        if question.is_replay:
+            contributed.sort(key=self.solvers.index)
+            (prediction, confidence) = self.update_confidence(question.text, matches, contributed)
+
+        # Report connection setup for the question
+        if not question.is_replay:
+            (total_handshakes, total_setup_time) = self.session.stats.snapshot()
+            print('\nConnections: %s handshakes, %.0fms setup' % (
+                total_handshakes - handshakes, (total_setup_time - setup_time) * 1000
+            ))
+
+        return self.commit_prediction(question, prediction, confidence, contributed)
+
+    @staticmethod
+    def show_question(question):
+        """ Show a question and its answers in console """
+        print('\n\n\n------------ QUESTION %s | %s ------------' %
+              (question.number, question.category))
+        print('%s\n\n------------ ANSWERS ------------\n%s\n------------------------' %
+              ((Colours.BOLD.value + question.text + Colours.ENDC.value), question.answers))
 
+    @staticmethod
+    def commit_prediction(question, prediction, confidence, contributed):
+        """ Add a prediction from the contributing solvers to a question and show it """
         # calculate confidences as percentage and add to q
         total_confidence = sum(confidence.values())
         for answer_key, count in confidence.items():
             likelihood = int(count/total_confidence * 100) if total_confidence else 0
             confidence[answer_key] = '%d%%' % likelihood
-        question.add_prediction(prediction, confidence)
+        question.add_prediction(prediction, confidence, [solver.__class__.__name__ for solver in contributed])
 
         # Show prediction in console
         print('\nPrediction:')
@@ -138,80 +295,126 @@ class HqTriviaBot(object):
         for winner in sorted(data.get('winners'), key=lambda k: k['wins'], reverse=True)[:20]:
             print(Colours.BOLD.value + winner.get('name') + Colours.ENDC.value + " (Wins: %s)" % winner.get('wins'))
 
+    def question_summary(self, data):
+        """ Save and display the correct answer of a question """
+        correct_index = next((n for (n, val)
+                              in enumerate(data.get('answerCounts'))
+                              if val["correct"]))
+        correct_choice = chr(65 + correct_index)  # A, B or C
+        if self.store is not None:
+            question = self.store.get(data.get('questionId'))
+        else:
+            question = Question(load_id=data.get('questionId'))
+        if question is None:
+            print('No prediction saved for question %s.' % data.get('questionId'))
+            return
+        question.add_correct(correct_choice)
+        question.display_summary()
+
+    def parse_question(self, data):
+        """ Create a Question from a question message """
+        if isinstance(data.get('answers'), list):
+            data['answers'] = {
+                'A': data.get('answers')[0]['text'],
+                'B': data.get('answers')[1]['text'],
+                'C': data.get('answers')[2]['text']
+            }
+        return Question(store=self.store, **data)
+
+    def predict_question(self, data, received=None, cancelled=None):
+        """ Predict the answer to a question message. Run on the dispatcher so the question is added
+        to the store opened for its game """
+        return self.prediction_time(self.parse_question(data), received, cancelled)
+
+    def log_message(self, message_type, message):
+        """ Print messages to log file """
+        if message_type not in HIDDEN_TYPES and self.message_log is not None:
+            self.message_log.write('MESSAGE: %s\n' % message)
+
     def on_message(self, web_socket, message):
-        """ Message handler """
-        data_start = message.find('{')
-        if data_start >= 0:
-            try:
-                data = loads(message[data_start:])
-                if data.get('type') == 'self.broadcast_ended' and not data.get('reason'):
-                    self.broadcast_ended = True
-                    print('BROADCAST ENDED.')
-                    web_socket.close()
-                elif data.get('type') == 'gameStatus':
-                    self.game_status(data)
-                elif data.get('type') == 'question' and data.get('answers'):
-                    if isinstance(data.get('answers'), list):
-                        data['answers'] = {
-                            'A': data.get('answers')[0]['text'],
-                            'B': data.get('answers')[1]['text'],
-                            'C': data.get('answers')[2]['text']
-                        }
-                    question = Question(**data)
-                    self.prediction_time(question)
-                # Check for question summary
-                elif data.get('type') == 'questionSummary':
-                    correct_index = next((n for (n, val)
-                                          in enumerate(data.get('answerCounts'))
-                                          if val["correct"]))
-                    correct_choice = chr(65 + correct_index)  # A, B or C
-                    question = Question(load_id=data.get('questionId'))
-                    question.add_correct(correct_choice)
-                    question.display_summary()
-                # Check for question summary
-                elif data.get('type') == 'gameSummary':
-                    self.game_summary(data)
-
-                # Print messages to log file
-                hidden_messages = ['interaction', 'broadcastStats', 'kicked']
-                if data.get('type') not in hidden_messages:
-                    with open('./games/messages.log', 'a') as file:
-                        if data.get('type') == 'gameStatus':
-                            file.write('\nNEW GAME: %s\n' % self.current_game)
-                        file.write('MESSAGE: %s\n' % message)
-            except JSONDecodeError:
-                print('ERROR - bad json: %s' % message)
+        """ Message handler. Only frames with handlers are decoded, and work that reads or writes
+        files runs on the dispatcher in the order messages arrive """
+        received = monotonic()
+        if self.capture is not None:
+            self.capture.record(message, received)
+        if self.rate_limited:
+            self.stop(web_socket)
+            return
+        try:
+            (message_type, data) = read_frame(message)
+        except ValueError:
+            print('ERROR - bad json: %s' % message)
+            return
+        if data is None:
+            pass
+        elif message_type == 'broadcastEnded' and not data.get('reason'):
+            self.broadcast_ended = True
+            print('BROADCAST ENDED.')
+            web_socket.close()
+            self.dispatcher.submit(self.end_game)
+        elif message_type == 'gameStatus':
+            self.rotate_game(data)
+            self.dispatcher.submit(self.open_store, data)
+            self.dispatcher.submit(self.warm_up)
+        elif message_type == 'question' and data.get('answers'):
+            self.dispatcher.submit_prediction(self.predict_question, data, received)
+        # Check for question summary
+        elif message_type == 'questionSummary':
+            self.dispatcher.submit(self.question_summary, data)
+        # Check for game summary
+        elif message_type == 'gameSummary':
+            self.game_summary(data)
+            self.dispatcher.submit(self.end_game)
+        if message_type is not None:
+            self.log_message(message_type, message)
+
+    def stop(self, web_socket):
+        """ Close the socket and stop looking for shows once searches are rate limited """
+        if not self.broadcast_ended:
+            print('Google rate limiting detected. Stopping the bot.')
+            self.broadcast_ended = True
+            web_socket.close()
 
     def run(self):
         """ Run the bot with a live game websocket """
         if not self.config.has_section('Auth'):
             exit('Error: Config file \'config.ini\' with [Auth] section not found. Please run generate-token.')
-        while True:
-            self.current_game = ''
-            self.broadcast_ended = False
-            socket_url = self.get_socket_url(self.headers)
-            if socket_url:
-                print('CONNECTING TO UK SHOW: %s' % socket_url)
-                web_socket = WebSocketApp(socket_url,
-                                          on_open=lambda _ws: print('CONNECTION SUCCESSFUL'),
-                                          on_message=self.on_message,
-                                          on_error=lambda _ws, err: print('ERROR: %s' % err),
-                                          on_close=lambda _ws: print('SOCKET CLOSED'),
-                                          header=self.headers)
-                while not self.broadcast_ended:
-                    try:
-                        web_socket.run_forever(ping_interval=5)
-                    except (WebSocketException, WebSocketTimeoutException):
-                        print('CONNECTION LOST. RECONNECTING...')
-            elif self.next_show_time:
-                next_show_time = parser.parse(self.next_show_time)
-                seconds_until_show = (next_show_time - datetime.now(utc)).total_seconds()
-                if seconds_until_show < 0:
-                    print('\nGame should have started. Sleeping for 10 seconds.')
-                    sleep(10)
+        try:
+            while True:
+                self.current_game = ''
+                self.broadcast_ended = False
+                socket_url = self.get_socket_url(self.headers)
+                if socket_url:
+                    print('CONNECTING TO UK SHOW: %s' % socket_url)
+                    if self.message_log is None:
+                        self.open_log()
+                    web_socket = WebSocketApp(socket_url,
+                                              on_open=lambda _ws: print('CONNECTION SUCCESSFUL'),
+                                              on_message=self.on_message,
+                                              on_error=lambda _ws, err: print('ERROR: %s' % err),
+                                              on_close=lambda _ws: print('SOCKET CLOSED'),
+                                              header=self.headers)
+                    while not self.broadcast_ended:
+                        try:
+                            web_socket.run_forever(ping_interval=5)
+                        except (WebSocketException, WebSocketTimeoutException):
+                            print('CONNECTION LOST. RECONNECTING...')
+                    if self.rate_limited:
+                        exit('ERROR: Google rate limiting detected.')
                 else:
-                    print('\nSleeping until {} ({} seconds)'.format(next_show_time.strftime('%c'), seconds_until_show))
-                    sleep(seconds_until_show)
-            else:
-                print(f'Could not connect to API at {self.api_url}. Sleeping for 10 seconds.')
-                sleep(10)
+                    sleep(self.sleep_time())
+        finally:
+            self.shutdown()
+
+    def sleep_time(self):
+        """ Seconds to sleep before checking for a show again """
+        if self.next_show_time:
+            next_show_time = parser.parse(self.next_show_time)
+            seconds_until_show = (next_show_time - datetime.now(utc)).total_seconds()
+            if seconds_until_show < 0:
+                print('\nGame should have started. Sleeping for 10 seconds.')
+                return 10
+            print('\nSleeping until {} ({} seconds)'.format(next_show_time.strftime('%c'), seconds_until_show))
+            return seconds_until_show
+        print(f'Could not connect to API at {self.api_url}. Sleeping for 10 seconds.')
+        return 10
@@ -1,59 +1,91 @@
 """ Perform caching operations """
-from sqlite3 import connect
+from sqlite3 import connect, complete_statement
+from hashlib import sha256
+from itertools import groupby
+from operator import itemgetter
 from os import path
-from json import load
 from glob import glob
-from requests import Request
+from configparser import ConfigParser
 from requests_cache import CachedSession
 from solvers import GoogleAnswerWordsSolver, GoogleResultsCountSolver
+from manifest import Manifest
+from refresh import Refresher
+from shards import SHARD_DIR, ShardedCache, shard_month
+from segment import TABLES, SEGMENT_EXTENSION, read_segment, write_segment, load_index, save_index
+
+
+def file_digest(filename):
+    """ SHA-256 hex digest of a file's contents """
+    digest = sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sql_statements(filename):
+    """ Yield the statements of an SQL dump, leaving out its own transaction statements """
+    statement = ''
+    with open(filename, 'r') as file:
+        for line in file:
+            statement += line
+            if complete_statement(statement):
+                if statement.strip().upper() not in ('BEGIN TRANSACTION;', 'COMMIT;'):
+                    yield statement
+                statement = ''
 
 
 class Cache:
     """ Cache class for operating on the local SQLite cache """
 
     def __init__(self):
+        self.config = ConfigParser()
+        self.config.read('config.ini')
         self.session = CachedSession('games/db/cache', allowable_codes=(200, 302, 304))
         self.solvers = [
             GoogleAnswerWordsSolver(),
             GoogleResultsCountSolver()
         ]
 
+    def update_manifest(self):
+        """ Open the cache manifest, adding games saved since it was last updated """
+        manifest = Manifest()
+        changed = manifest.update(self.session, self.solvers)
+        if changed:
+            print('Updated manifest for %s games' % changed)
+        return manifest
+
     def prune(self):
         """ Prune stale entries from the local cache """
-        urls = []
-        for solver in self.solvers:
-            for filename in sorted(glob('games/json/*.json')):
-                game = load(open(filename))
-                for turn in game.get('questions'):
-                    urls.extend(solver.build_urls(turn.get('question'), turn.get('answers')).values())
+        manifest = self.update_manifest()
+        (keys, urls) = (manifest.keys(), manifest.urls())
+        manifest.close()
+        cached_keys = list(self.session.cache.responses.keys())
         stale_entries = []
-        for key, (resp, _) in self.session.cache.responses.items():
+        for key in cached_keys:
+            if key in keys:
+                continue
+            (resp, _) = self.session.cache.responses[key]
             if resp.url not in urls and not any(step.url in urls for step in resp.history):
                 stale_entries.append((key, resp))
-        print('Found %s/%s stale entries' % (len(stale_entries), len(self.session.cache.responses.keys())))
+        print('Found %s/%s stale entries' % (len(stale_entries), len(cached_keys)))
         for key, resp in stale_entries:
             print('Deleting stale entry: %s' % resp.url)
             self.session.cache.delete(key)
 
     def refresh(self):
         """ Refresh the local cache with unsaved questions """
-        urls = []
-        for solver in self.solvers:
-            for filename in sorted(glob('games/json/*.json')):
-                game = load(open(filename))
-                for turn in game.get('questions'):
-                    urls.extend(solver.build_urls(turn.get('question'), turn.get('answers')).values())
-        cache_misses = [
-            url for url in urls if not self.session.cache.create_key(
-                self.session.prepare_request(Request('GET', url))
-            ) in self.session.cache.responses
-        ]
-        print('Found %s/%s URLs not in cache' % (len(cache_misses), len(urls)))
-        for idx, url in enumerate(cache_misses):
-            print('Adding cached entry: %s' % url)
-            response = self.session.get(url)
-            if '/sorry/index?continue=' in response.url:
-                exit('ERROR: Google rate limiting detected. Cached %s pages.' % idx)
+        manifest = self.update_manifest()
+        cache_misses = manifest.missing()
+        print('Found %s/%s URLs not in cache' % (len(cache_misses), len(manifest.keys())))
+        manifest.close()
+        refresher = Refresher(self.session,
+                              rate=self.config.getfloat('Cache', 'refresh_rate', fallback=1.0),
+                              workers=self.config.getint('Cache', 'refresh_workers', fallback=4))
+        if not refresher.run(cache_misses):
+            exit('ERROR: Refresh did not fetch every URL. Cached %s pages.' % refresher.fetched)
+        if self.config.has_option('Cache', 'max_size_mb'):
+            self.shard()
 
     @staticmethod
     def vacuum():
@@ -63,47 +95,115 @@ class Cache:
         conn.close()
 
     @staticmethod
-    def import_sql():
-        """ Import saved SQL dumps into a local SQLite cache """
-        conn = connect("games/db/cache.sqlite")
-        for filename in sorted(glob('games/db/*.sql')):
-            print('Importing SQL %s' % filename)
-            sql = open(filename, 'r').read()
-            cur = conn.cursor()
-            cur.executescript(sql)
+    def import_sql(db_path='games/db/cache.sqlite', directory='games/db'):
+        """ Import new or changed cache segments and SQL dumps into a local SQLite cache """
+        conn = connect(db_path, isolation_level=None)
+        conn.execute('pragma journal_mode = wal')
+        conn.execute('pragma synchronous = off')
+        for table in TABLES:
+            conn.execute('create table if not exists %s (key PRIMARY KEY, value)' % table)
+        conn.execute('create table if not exists imported_dumps '
+                     '(filename text primary key, size integer, mtime real, digest text)')
+        imported = {filename: (size, mtime, digest) for (filename, size, mtime, digest)
+                    in conn.execute('select * from imported_dumps')}
+        filenames = sorted(glob(path.join(directory, '*.sql')) + glob(path.join(directory, '*' + SEGMENT_EXTENSION)))
+        applied = 0
+        conn.execute('begin')
+        try:
+            for filename in filenames:
+                (name, size, mtime) = (path.basename(filename), path.getsize(filename), path.getmtime(filename))
+                (imported_size, imported_mtime, imported_digest) = imported.get(name, (None, None, None))
+                if (imported_size, imported_mtime) == (size, mtime):
+                    continue
+                digest = file_digest(filename)
+                if digest != imported_digest:
+                    print('Importing %s' % filename)
+                    if filename.endswith('.sql'):
+                        for statement in sql_statements(filename):
+                            conn.execute(statement)
+                    else:
+                        for table, rows in groupby(read_segment(filename), itemgetter(0)):
+                            conn.executemany('insert or ignore into %s values (?, ?)' % table,
+                                             (row[1:] for row in rows))
+                    applied += 1
+                conn.execute('insert or replace into imported_dumps values (?, ?, ?, ?)', (name, size, mtime, digest))
+            conn.execute('commit')
+        except BaseException:
+            conn.execute('rollback')
+            raise
+        finally:
+            # Leave WAL mode so read-only immutable readers see every row in the database file
+            conn.execute('pragma journal_mode = delete')
+            conn.close()
+        print('Imported %s/%s dumps' % (applied, len(filenames)))
+
+    @staticmethod
+    def export_sql(show_id, filename, db_path='games/db/cache.sqlite'):
+        """ Write a show's cached responses to a legacy SQL dump """
+        conn = connect(':memory:')
+        cur = conn.cursor()
+        cur.execute("attach database ? as cache", (db_path,))
+        cur.execute("select sql from cache.sqlite_master where type='table' and name='urls'")
+        cur.execute(cur.fetchone()[0])
+        cur.execute("select sql from cache.sqlite_master where type='table' and name='responses'")
+        cur.execute(cur.fetchone()[0])
+        for table in TABLES:
+            cur.execute("insert into %s select * from cache.%s where key in "
+                        "(select key from cache.manifest where game = ?)" % (table, table), (show_id,))
+        conn.commit()
+        cur.execute("detach database cache")
+        with open(filename, 'w') as file:
+            for line in conn.iterdump():
+                file.write('%s\n' % line.replace(
+                    'TABLE', 'TABLE IF NOT EXISTS'
+                ).replace(
+                    'INSERT', 'INSERT OR IGNORE'
+                ))
         conn.close()
 
+    @staticmethod
+    def export_segment(conn, show_id, filename, schemas=('main',)):
+        """ Write a show's cached responses from the main cache and any attached shards to a compressed segment,
+        returning the number of rows """
+        return write_segment(filename, conn.execute(' union all '.join(
+            "select '%s', key, value from %s.%s where %s in (select key from main.manifest where game = :game)" % (
+                table, schema, table, 'value' if table == 'urls' else 'key'
+            ) for table in TABLES for schema in schemas
+        ), {'game': show_id}))
+
     def export(self):
-        """ Export the local cache to SQL dump files """
-        for filename in sorted(glob('games/json/*.json')):
-            game = load(open(filename))
-            show_id = path.basename(filename).split('.')[0]
-            if not path.isfile('./games/db/%s.sql' % show_id):
-                print('Exporting SQL %s' % show_id)
-                urls = []
-                for solver in self.solvers:
-                    for turn in game.get('questions'):
-                        urls.extend(solver.build_urls(turn.get('question'), turn.get('answers')).values())
-                url_keys = [self.session.cache.create_key(
-                    self.session.prepare_request(Request('GET', url))
-                ) for url in urls]
-                conn = connect(':memory:')
-                cur = conn.cursor()
-                cur.execute("attach database 'games/db/cache.sqlite' as cache")
-                cur.execute("select sql from cache.sqlite_master where type='table' and name='urls'")
-                cur.execute(cur.fetchone()[0])
-                cur.execute("select sql from cache.sqlite_master where type='table' and name='responses'")
-                cur.execute(cur.fetchone()[0])
-                for key in list(set(url_keys)):
-                    cur.execute("insert into urls select * from cache.urls where key = '%s'" % key)
-                    cur.execute("insert into responses select * from cache.responses where key = '%s'" % key)
-                conn.commit()
-                cur.execute("detach database cache")
-                with open('games/db/%s.sql' % show_id, 'w') as file:
-                    for line in conn.iterdump():
-                        file.write('%s\n' % line.replace(
-                            'TABLE', 'TABLE IF NOT EXISTS'
-                        ).replace(
-                            'INSERT', 'INSERT OR IGNORE'
-                        ))
-                conn.close()
+        """ Export the local cache to compressed segment files """
+        manifest = self.update_manifest()
+        index = load_index()
+        conn = connect('games/db/cache.sqlite')
+        for show_id in manifest.games():
+            if show_id not in index and not path.isfile('./games/db/%s.sql' % show_id):
+                print('Exporting segment %s' % show_id)
+                filename = 'games/db/%s%s' % (show_id, SEGMENT_EXTENSION)
+                shard_path = path.join(SHARD_DIR, '%s.sqlite' % shard_month(show_id))
+                schemas = ['main']
+                if path.isfile(shard_path):
+                    conn.execute('attach database ? as shard', (shard_path,))
+                    schemas.append('shard')
+                conn.execute('begin')
+                rows = self.export_segment(conn, show_id, filename, schemas)
+                conn.rollback()
+                if len(schemas) > 1:
+                    conn.execute('detach database shard')
+                index[show_id] = {'segment': path.basename(filename), 'rows': rows, 'bytes': path.getsize(filename)}
+        conn.close()
+        manifest.close()
+        save_index(index)
+
+    def shard(self):
+        """ Move cached responses into monthly shards, evicting shards over the size cap """
+        self.update_manifest().close()
+        max_size = self.config.getfloat('Cache', 'max_size_mb', fallback=None)
+        sharded = ShardedCache(max_bytes=max_size * 1e6 if max_size else None,
+                               eviction=self.config.get('Cache', 'eviction', fallback='lru'))
+        moved = sharded.split()
+        evicted = sharded.evict()
+        print('Moved %s responses to shards. Evicted %s shards%s. Cache is %.1fMB' % (
+            moved, len(evicted), ' (%s)' % ', '.join(evicted) if evicted else '', sharded.size() / 1e6
+        ))
+        sharded.close()
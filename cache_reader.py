@@ -0,0 +1,81 @@
+""" Read-only, memory mapped access to the response cache """
+import os
+import pickle
+from collections import OrderedDict
+from sqlite3 import connect, OperationalError
+from requests import Request, Session
+from requests_cache.backends.base import BaseCache
+from shards import readonly_uri
+
+MMAP_SIZE = 1 << 30
+MAX_ATTACHED = 8
+
+
+class CacheReader(object):
+    """ Reads responses from the requests_cache SQLite database opened immutable and memory mapped.
+    Nothing is locked or written, so many processes can read the cache at once. Month shards
+    holding responses moved out of the main cache are attached when first read """
+
+    def __init__(self, path='games/db/cache.sqlite', mmap_size=MMAP_SIZE):
+        self.path = path
+        self.mmap_size = mmap_size
+        self.keys = BaseCache()
+        self.requests = Session()
+        self.conn = None
+        self.attached = OrderedDict()
+        self.sharded = False
+        self.open()
+
+    def open(self):
+        """ Open the cache, reopening it if already open so rows written since are read """
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = connect(readonly_uri(self.path), uri=True, check_same_thread=False)
+        self.conn.execute('pragma mmap_size = %d' % self.mmap_size)
+        self.attached.clear()
+        self.sharded = self.conn.execute(
+            "select count(*) from sqlite_master where type = 'table' and name = 'shard_keys'"
+        ).fetchone()[0] > 0
+
+    def create_key(self, url):
+        """ Cache key of a GET request for a URL """
+        return self.keys.create_key(self.requests.prepare_request(Request('GET', url)))
+
+    def lookup(self, schema, key):
+        """ Pickled response for a key in the main cache or an attached shard, following redirects """
+        return self.conn.execute(('select value from {0}.responses where key = ? union all '
+                                  'select value from {0}.responses where key = '
+                                  '(select value from {0}.urls where key = ?)').format(schema), (key, key)).fetchone()
+
+    def attach(self, month):
+        """ Attach a month shard if not already attached, detaching the least recently read beyond the limit """
+        schema = 'shard_%s' % month.replace('-', '_')
+        if schema in self.attached:
+            self.attached.move_to_end(schema)
+            return schema
+        (path,) = self.conn.execute('select path from shards where month = ?', (month,)).fetchone()
+        if len(self.attached) >= MAX_ATTACHED:
+            self.conn.execute('detach database %s' % self.attached.popitem(last=False)[0])
+        self.conn.execute('attach database ? as %s' % schema, (readonly_uri(path),))
+        os.utime(path)
+        self.attached[schema] = path
+        return schema
+
+    def get(self, url):
+        """ Return the cached response for a URL, or None if not cached """
+        key = self.create_key(url)
+        row = self.lookup('main', key)
+        if row is None and self.sharded:
+            shard = self.conn.execute('select month from shard_keys where key = ?', (key,)).fetchone()
+            try:
+                row = self.lookup(self.attach(shard[0]), key) if shard else None
+            except OperationalError:
+                row = None
+        if row is None:
+            return None
+        (response, _) = pickle.loads(bytes(row[0]))
+        return self.keys.restore_response(response)
+
+    def close(self):
+        """ Close the database connection """
+        self.conn.close()
@@ -0,0 +1,121 @@
+""" Capture raw socket frames and play them back into the bot """
+import os
+import gzip
+import tempfile
+from bisect import bisect_right
+from glob import glob
+from json import dumps, loads
+from time import sleep, monotonic
+from message_log import MessageLog
+from utils import Colours
+
+
+class CaptureLog(MessageLog):
+    """ Records every raw socket frame with the monotonic time it was received, one game per segment """
+
+    def __init__(self, directory='./games/captures', **kwargs):
+        super(CaptureLog, self).__init__(directory=directory, segment='capture', **kwargs)
+
+    def record(self, message, received):
+        """ Queue a frame with the time it was received """
+        self.write(dumps([round(received, 6), message], ensure_ascii=False) + '\n')
+
+
+def load_capture(path):
+    """ Load (received, frame) pairs from a capture, compressed or not """
+    frames = []
+    for filename in sorted(glob(path + '.gz')) + sorted(glob(path)):
+        with (gzip.open if filename.endswith('.gz') else open)(filename, 'rt') as file:
+            frames.extend(tuple(loads(line)) for line in file if line.strip())
+    return frames
+
+
+def load_captures(directory='./games/captures'):
+    """ Load (received, frame) pairs from every capture in a directory """
+    paths = sorted(set(path[:-len('.gz')] if path.endswith('.gz') else path
+                       for path in glob(os.path.join(directory, '*.log*'))))
+    return [frame for path in paths for frame in load_capture(path)]
+
+
+def percentile(values, fraction):
+    """ Value at a fraction of the way through sorted values """
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0
+
+
+class PlaybackSocket(object):
+    """ Stands in for the web socket passed to the message handler """
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        """ Stop playing frames """
+        self.closed = True
+
+
+class Playback(object):
+    """ Plays captured frames into HqTriviaBot.on_message with their original spacing scaled by speed,
+    or back to back if speed is None, and measures how far handling falls behind the socket.
+    Connections are not warmed up and questions are given a placeholder prediction, so playback never searches """
+
+    def __init__(self, trivia_bot, frames, directory=None):
+        self.bot = trivia_bot
+        self.frames = frames
+        self.directory = directory or tempfile.mkdtemp(prefix='playback-')
+        self.handler_latency = []
+        self.latency = []
+        self.backlog = []
+
+    def predict(self, question, received=None, cancelled=None): # pylint: disable=unused-argument
+        """ Stand in for HqTriviaBot.prediction_time, committing a prediction without solvers """
+        self.bot.show_question(question)
+        return self.bot.commit_prediction(question, 'A', {'A': 0, 'B': 0, 'C': 0}, [])
+
+    def prepare(self):
+        """ Point the bot at the playback directory and stop it from searching """
+        self.bot.open_browser = False
+        self.bot.prediction_time = self.predict
+        self.bot.warm_up = lambda: None
+        self.bot.games_dir = os.path.join(self.directory, 'json')
+        self.bot.open_log(os.path.join(self.directory, 'logs'))
+        os.makedirs(self.bot.games_dir, exist_ok=True)
+
+    def finish(self):
+        """ Wait for queued handlers, then write the game and message log """
+        self.bot.dispatcher.submit(self.bot.end_game).result()
+        self.bot.message_log.close()
+
+    def play(self, speed=1.0):
+        """ Play every frame, returning the number played """
+        self.prepare()
+        web_socket = PlaybackSocket()
+        first = self.frames[0][0] if self.frames else 0
+        due = [(received - first) / speed if speed else 0 for (received, _) in self.frames]
+        finished = []
+        start = monotonic()
+        for index, (_, message) in enumerate(self.frames):
+            if web_socket.closed:
+                break
+            wait = start + due[index] - monotonic()
+            if wait > 0:
+                sleep(wait)
+            now = monotonic() - start
+            self.backlog.append(bisect_right(due, now) - index - 1)
+            self.bot.on_message(web_socket, message)
+            self.handler_latency.append(monotonic() - start - due[index])
+            finished.append((due[index], self.bot.dispatcher.submit(monotonic)))
+        self.latency = [future.result() - start - offset for (offset, future) in finished]
+        self.finish()
+        return len(finished)
+
+    def report(self):
+        """ Print handler latency and socket backlog percentiles """
+        print(Colours.BOLD.value + 'Played %s frames' % len(self.latency) + Colours.ENDC.value)
+        for name, values, unit in [('handler', self.handler_latency, 1000),
+                                   ('end to end', self.latency, 1000),
+                                   ('backlog', self.backlog, 1)]:
+            print('%-12s median %8.2f  p95 %8.2f  max %8.2f%s' % (
+                name, percentile(values, 0.5) * unit, percentile(values, 0.95) * unit,
+                max(values or [0]) * unit, 'ms' if unit != 1 else ' frames'
+            ))
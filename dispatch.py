@@ -0,0 +1,72 @@
+""" Dispatch socket messages to handlers off the socket thread """
+import re
+from json import loads
+from concurrent.futures import Future, ThreadPoolExecutor
+try:
+    from orjson import loads as decode
+except ImportError:
+    try:
+        from ujson import loads as decode
+    except ImportError:
+        decode = loads
+
+HANDLED_TYPES = ['broadcastEnded', 'gameStatus', 'question', 'questionSummary', 'gameSummary']
+HIDDEN_TYPES = ['interaction', 'broadcastStats', 'kicked']
+HANDLED_FRAME = re.compile(r'"type"\s*:\s*"(?:%s)"' % '|'.join(HANDLED_TYPES))
+FRAME_TYPE = re.compile(r'"type"\s*:\s*"([^"]*)"')
+
+
+def read_frame(message):
+    """ Return the type of a frame and, only if it may have a handler, its decoded data.
+    Other frames are not decoded, their type is read from the first type field.
+    Raises ValueError if a frame with a handler is not valid JSON """
+    data_start = message.find('{')
+    if data_start < 0:
+        return None, None
+    if not HANDLED_FRAME.search(message, data_start):
+        match = FRAME_TYPE.search(message, data_start)
+        return match.group(1) if match else None, None
+    data = decode(message[data_start:])
+    return data.get('type'), data
+
+
+class Dispatcher(object):
+    """ Runs slow message handlers in order on a worker thread so the socket reader never blocks.
+    Submitting a new question cancels the prediction in flight for the previous one """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.prediction = None
+        self.cancelled = None
+
+    @staticmethod
+    def report(future):
+        """ Print errors raised by handlers, which would otherwise be lost in the future """
+        if not future.cancelled() and future.exception():
+            print('ERROR: %s' % future.exception())
+
+    def submit(self, handler, *args):
+        """ Queue a handler to run after any handlers already queued """
+        future = self.executor.submit(handler, *args)
+        future.add_done_callback(self.report)
+        return future
+
+    def cancel(self):
+        """ Cancel the prediction in flight, if any """
+        if self.prediction:
+            self.prediction.cancel()
+        if self.cancelled and not self.cancelled.done():
+            self.cancelled.set_result(True)
+
+    def submit_prediction(self, handler, question, received):
+        """ Queue a prediction, cancelling the one for any previous question.
+        The handler is passed a future that completes when it should stop """
+        self.cancel()
+        self.cancelled = Future()
+        self.prediction = self.submit(handler, question, received, self.cancelled)
+        return self.prediction
+
+    def shutdown(self):
+        """ Cancel in flight work and wait for the worker to finish """
+        self.cancel()
+        self.executor.shutdown(wait=True)
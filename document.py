@@ -0,0 +1,186 @@
+""" Extracted search page parts shared by solver responses """
+from weakref import WeakKeyDictionary
+from html.parser import HTMLParser
+
+SNIPPET_CLASSES = ['st', 'r', 'mod', 'brs_col']
+STAT_IDS = ['resultStats', 'topstuff']
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+# Elements the HTML5 parsing rules close implicitly when a sibling starts
+HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+CLOSES_P = HEADINGS | {'address', 'article', 'aside', 'blockquote', 'center', 'details', 'dialog', 'dir', 'div',
+                       'dl', 'dd', 'dt', 'fieldset', 'figcaption', 'figure', 'footer', 'form', 'header', 'hgroup',
+                       'hr', 'li', 'listing', 'main', 'menu', 'nav', 'ol', 'p', 'plaintext', 'pre', 'section',
+                       'summary', 'table', 'ul', 'xmp'}
+SPECIAL_ELEMENTS = CLOSES_P | VOID_ELEMENTS | {'applet', 'basefont', 'bgsound', 'body', 'button', 'caption',
+                                               'colgroup', 'frame', 'frameset', 'head', 'html', 'iframe', 'marquee',
+                                               'noembed', 'noframes', 'noscript', 'object', 'script', 'select',
+                                               'style', 'tbody', 'td', 'template', 'textarea', 'tfoot', 'th',
+                                               'thead', 'title', 'tr'}
+BUTTON_SCOPE = {'applet', 'button', 'caption', 'html', 'marquee', 'object', 'table', 'td', 'template', 'th'}
+TABLE_SCOPE = {'html', 'table', 'template'}
+TABLE_CLOSES = {'td': {'td', 'th'}, 'th': {'td', 'th'}, 'tr': {'td', 'th', 'tr'},
+                'tbody': {'td', 'th', 'tr', 'tbody', 'thead', 'tfoot'}}
+TABLE_CLOSES['thead'] = TABLE_CLOSES['tfoot'] = TABLE_CLOSES['tbody']
+CHUNK_SIZE = 16384
+EXTRACTOR_VERSION = 2
+
+_extracts = WeakKeyDictionary()
+
+
+class Serp(object):
+    """ The parts of a search results page read by solvers """
+
+    def __init__(self, results=None, stats=None):
+        self.snippets = {name: [] for name in SNIPPET_CLASSES}
+        self.stats = stats or {}
+        self.complete = False
+        self._results = results
+
+    @property
+    def results(self):
+        """ Snippet text joined in the same order as the solvers search classes """
+        if self._results is not None:
+            return self._results
+        return ''.join(' ' + ''.join(buffer) for name in SNIPPET_CLASSES for buffer in self.snippets[name])
+
+    @property
+    def result_stats(self):
+        """ Text of the result count element, or None if not found """
+        return self.stats.get('resultStats')
+
+    @property
+    def topstuff(self):
+        """ Text of the top notice element, or empty if not found """
+        return self.stats.get('topstuff', '')
+
+
+class SerpExtractor(HTMLParser):
+    """ Streaming parser collecting the text of snippet classes and stat ids only """
+
+    def __init__(self, stop_ids=None):
+        super(SerpExtractor, self).__init__(convert_charrefs=True)
+        self.serp = Serp()
+        self.stop_ids = set(stop_ids or [])
+        self._stack = []
+        self._buffers = []
+
+    @property
+    def done(self):
+        """ True once every id we need to stop at has been read """
+        return bool(self.stop_ids) and self.stop_ids.issubset(self.serp.stats)
+
+    def handle_starttag(self, tag, attrs):
+        self._close_implied(tag)
+        if tag in VOID_ELEMENTS:
+            return
+        attrs = dict(attrs)
+        targets = []
+        for name in (attrs.get('class') or '').split():
+            if name in self.serp.snippets:
+                targets.append((None, []))
+                self.serp.snippets[name].append(targets[-1][1])
+        element_id = attrs.get('id')
+        if element_id in STAT_IDS and element_id not in self.serp.stats and \
+                not any(stat_id == element_id for (_, open_targets) in self._stack for (stat_id, _) in open_targets):
+            targets.append((element_id, []))
+        self._stack.append((tag, targets))
+        self._buffers.extend(buffer for (_, buffer) in targets)
+
+    def handle_startendtag(self, tag, attrs):
+        # HTML ignores the slash of a self-closing element that is not void, so <div/> stays open
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if any(open_tag == tag for (open_tag, _) in self._stack):
+            self._close(tag)
+
+    def _close(self, tag):
+        """ Close open elements up to and including the innermost with a tag """
+        while self._pop() != tag:
+            pass
+
+    def _in_scope(self, tags, scope):
+        """ The outermost open element with one of the tags, searching inwards to outwards until an element
+        of the scope, or None if there is none """
+        found = None
+        for (open_tag, _) in reversed(self._stack):
+            if open_tag in tags:
+                found = open_tag
+            elif open_tag in scope:
+                break
+        return found
+
+    def _close_implied(self, tag):
+        """ Close the elements a start tag ends implicitly, such as an open li when the next li starts """
+        current = self._stack[-1][0] if self._stack else None
+        if tag in CLOSES_P and self._in_scope({'p'}, BUTTON_SCOPE):
+            self._close('p')
+            current = self._stack[-1][0] if self._stack else None
+        if tag in ('li', 'dd', 'dt'):
+            siblings = {'li'} if tag == 'li' else {'dd', 'dt'}
+            for (open_tag, _) in reversed(self._stack):
+                if open_tag in siblings:
+                    self._close(open_tag)
+                    break
+                if open_tag in SPECIAL_ELEMENTS and open_tag not in ('address', 'div', 'p'):
+                    break
+        elif tag in TABLE_CLOSES:
+            open_tag = self._in_scope(TABLE_CLOSES[tag], TABLE_SCOPE)
+            if open_tag:
+                self._close(open_tag)
+        elif tag in HEADINGS and current in HEADINGS:
+            self._close(current)
+        elif tag == 'option' and current == 'option':
+            self._close('option')
+        elif tag == 'optgroup' and current in ('option', 'optgroup'):
+            self._close(current)
+            if current == 'option' and self._stack and self._stack[-1][0] == 'optgroup':
+                self._close('optgroup')
+
+    def _pop(self):
+        """ Close the innermost open element and return its tag """
+        (tag, targets) = self._stack.pop()
+        del self._buffers[len(self._buffers) - len(targets):]
+        for (stat_id, buffer) in targets:
+            if stat_id:
+                self.serp.stats[stat_id] = ''.join(buffer)
+        return tag
+
+    def handle_data(self, data):
+        for buffer in self._buffers:
+            buffer.append(data)
+
+    def extract(self, text):
+        """ Feed text in chunks until finished or every stop id has been read """
+        for start in range(0, len(text), CHUNK_SIZE):
+            self.feed(text[start:start + CHUNK_SIZE])
+            if self.done:
+                return self.serp
+        self.close()
+        while self._stack:
+            self._pop()
+        self.serp.complete = True
+        return self.serp
+
+
+class ExtractedResponse(object):
+    """ Stands in for a response whose search page parts have already been extracted """
+
+    def __init__(self, url, serp):
+        self.url = url
+        self.serp = serp
+
+
+def extract(response, stop_ids=None):
+    """ Return the extracted search page parts for a response, reading it only once.
+    With stop_ids, reading stops as soon as those elements have been read """
+    if isinstance(response, ExtractedResponse):
+        return response.serp
+    try:
+        serp = _extracts.get(response)
+    except TypeError:
+        return SerpExtractor(stop_ids).extract(response.text)
+    if serp is None or not (serp.complete or stop_ids and set(stop_ids).issubset(serp.stats)):
+        serp = _extracts[response] = SerpExtractor(stop_ids).extract(response.text)
+    return serp
@@ -0,0 +1,224 @@
+""" Live bot engine running on a single asyncio event loop """
+import asyncio
+import webbrowser
+from time import monotonic
+from json import JSONDecodeError
+from urllib.parse import urlparse
+from aiohttp import ClientSession, ClientError, ClientTimeout, TCPConnector, WSMsgType
+from bot import HqTriviaBot
+from dispatch import read_frame
+from solvers import RateLimited
+
+
+class SearchResponse(object):
+    """ A fetched search page with the attributes solvers read from a requests response """
+
+    def __init__(self, url, text):
+        self.url = url
+        self.text = text
+
+
+class AsyncHqTriviaBot(HqTriviaBot):
+    """ HQ Trivia bot handling the socket, show polling and solver fetches on one event loop """
+
+    def __init__(self):
+        super(AsyncHqTriviaBot, self).__init__()
+        self.client = None
+        self.prediction = None
+        self.tasks = set()
+
+    def schedule(self, coroutine):
+        """ Run a coroutine in the background, keeping track of it until it finishes """
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def run_io(self, handler, *args):
+        """ Run a handler that reads or writes game files on the dispatcher, in the order handlers are queued,
+        so the event loop never waits on disk """
+        return asyncio.wrap_future(self.dispatcher.submit(handler, *args))
+
+    async def get_socket_url_async(self, headers):
+        """ Get broadcast socket URL """
+        try:
+            async with self.client.get(self.api_url + '/shows/now?type=hq&userId=%s' %
+                                       self.config['Auth']['user_id'], headers=headers) as resp:
+                initial_json = await resp.json(content_type=None)
+        except (ClientError, asyncio.TimeoutError, JSONDecodeError):
+            return None
+        return self.parse_show(initial_json)
+
+    async def fetch(self, url):
+        """ Fetch a search page """
+        async with self.client.get(url, timeout=ClientTimeout(total=self.deadline)) as response:
+            return SearchResponse(str(response.url), await response.text())
+
+    async def head(self, url):
+        """ Send a HEAD request, opening a connection to the host if none are free """
+        async with self.client.head(url, timeout=ClientTimeout(total=self.deadline)) as response:
+            return response.status
+
+    async def warm_up_async(self, connections=10):
+        """ Open connections to search services before the first question """
+        origins = set('{0.scheme}://{0.netloc}/'.format(urlparse(solver.service_url)) for solver in self.solvers)
+        results = await asyncio.gather(*[self.head(origin) for origin in origins for _ in range(connections)],
+                                       return_exceptions=True)
+        print('Warmed %s connections' % sum(1 for result in results if not isinstance(result, Exception)))
+
+    async def predict(self, data, received):
+        """ Predict the answer to a question message using Solver instances within the deadline """
+        question = await self.run_io(self.parse_question, data)
+        self.show_question(question)
+        if self.open_browser:
+            webbrowser.open('https://www.google.co.uk/search?pws=0&q=' + question.text)
+
+        # Fetch every unique solver URL once and score responses as they arrive
+        requests = {}
+        remaining = {}
+        for solver in self.solvers:
+            urls = solver.build_urls(question.text, question.answers)
+            remaining[solver] = len(urls)
+            for answer_key, url in urls.items():
+                requests.setdefault(url, []).append((solver, answer_key))
+        waiting = {asyncio.ensure_future(self.fetch(url)): items for url, items in requests.items()}
+        matches = {solver: {'A': 0, 'B': 0, 'C': 0} for solver in self.solvers}
+        contributed = []
+        prediction = 'A'
+        confidence = {'A': 0, 'B': 0, 'C': 0}
+        pending = set(waiting)
+        try:
+            while pending:
+                (done, pending) = await asyncio.wait(pending, timeout=max(received + self.deadline - monotonic(), 0),
+                                                     return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print('\nDeadline of %ss reached. Predicting with %s/%s solvers.' % (
+                        self.deadline, len(contributed), len(self.solvers)
+                    ))
+                    break
+                for task in done:
+                    try:
+                        response = task.result()
+                    except (ClientError, asyncio.TimeoutError) as err:
+                        print('ERROR: %s' % err)
+                        continue
+                    for solver, answer_key in waiting[task]:
+                        if not remaining[solver]:
+                            continue
+                        print('\n%s (%s): ' % (solver.name, answer_key))
+                        try:
+                            matches[solver] = solver.score(response, answer_key, question.answers, matches[solver])
+                        except RateLimited:
+                            print('\nERROR: Google rate limiting detected. Predicting without %s.' % solver.name)
+                            self.rate_limited = True
+                            remaining[solver] = 0
+                            continue
+                        remaining[solver] -= 1
+                        if not remaining[solver]:
+                            contributed.append(solver)
+                (prediction, confidence) = self.update_confidence(question.text, matches, contributed)
+        finally:
+            for task in pending:
+                task.cancel()
+        print('\nFetched %s URLs' % len(requests))
+
+        return await self.run_io(self.commit_prediction, question, prediction, confidence, contributed)
+
+    async def summarise(self, data, prediction):
+        """ Save and display the correct answer once the question's prediction has finished """
+        if prediction:
+            await asyncio.wait([prediction])
+        await self.run_io(self.question_summary, data)
+
+    async def finish(self, prediction):
+        """ Write the current game once its last prediction has finished """
+        if prediction:
+            await asyncio.wait([prediction])
+        await self.run_io(self.end_game)
+
+    def stop(self, web_socket):
+        """ Close the socket and stop looking for shows once searches are rate limited """
+        if not self.broadcast_ended:
+            print('Google rate limiting detected. Stopping the bot.')
+            self.broadcast_ended = True
+            self.schedule(web_socket.close())
+
+    def handle(self, web_socket, message):
+        """ Message handler. Slow work is scheduled on the event loop so reading never blocks """
+        received = monotonic()
+        if self.capture is not None:
+            self.capture.record(message, received)
+        if self.rate_limited:
+            self.stop(web_socket)
+            return
+        try:
+            (message_type, data) = read_frame(message)
+        except ValueError:
+            print('ERROR - bad json: %s' % message)
+            return
+        if data is None:
+            pass
+        elif message_type == 'broadcastEnded' and not data.get('reason'):
+            self.broadcast_ended = True
+            print('BROADCAST ENDED.')
+            self.schedule(web_socket.close())
+        elif message_type == 'gameStatus':
+            self.rotate_game(data)
+            self.schedule(self.run_io(self.open_store, data))
+            self.schedule(self.warm_up_async())
+        elif message_type == 'question' and data.get('answers'):
+            if self.prediction and not self.prediction.done():
+                self.prediction.cancel()
+            self.prediction = self.schedule(self.predict(data, received))
+        elif message_type == 'questionSummary':
+            self.schedule(self.summarise(data, self.prediction))
+        elif message_type == 'gameSummary':
+            self.game_summary(data)
+            self.schedule(self.finish(self.prediction))
+        if message_type is not None:
+            self.log_message(message_type, message)
+
+    async def play(self, socket_url):
+        """ Play a game on the broadcast socket until it closes """
+        async with self.client.ws_connect(socket_url, headers=self.headers, heartbeat=5) as web_socket:
+            print('CONNECTION SUCCESSFUL')
+            async for message in web_socket:
+                if message.type == WSMsgType.TEXT:
+                    self.handle(web_socket, message.data)
+                elif message.type == WSMsgType.ERROR:
+                    print('ERROR: %s' % web_socket.exception())
+        print('SOCKET CLOSED')
+        if self.tasks:
+            await asyncio.wait(self.tasks)
+        await self.run_io(self.end_game)
+
+    async def run_async(self):
+        """ Poll for shows and play them """
+        async with ClientSession(connector=TCPConnector(limit_per_host=10, keepalive_timeout=60)) as client:
+            self.client = client
+            while True:
+                self.current_game = ''
+                self.broadcast_ended = False
+                socket_url = await self.get_socket_url_async(self.headers)
+                if socket_url:
+                    print('CONNECTING TO UK SHOW: %s' % socket_url)
+                    if self.message_log is None:
+                        self.open_log()
+                    while not self.broadcast_ended:
+                        try:
+                            await self.play(socket_url)
+                        except (ClientError, asyncio.TimeoutError):
+                            print('CONNECTION LOST. RECONNECTING...')
+                    if self.rate_limited:
+                        exit('ERROR: Google rate limiting detected.')
+                else:
+                    await asyncio.sleep(self.sleep_time())
+
+    def run(self):
+        """ Run the bot with a live game websocket on an asyncio event loop """
+        if not self.config.has_section('Auth'):
+            exit('Error: Config file \'config.ini\' with [Auth] section not found. Please run generate-token.')
+        try:
+            asyncio.get_event_loop().run_until_complete(self.run_async())
+        finally:
+            self.shutdown()
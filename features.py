@@ -0,0 +1,147 @@
+""" Cache of the search page parts solvers read, so replays skip raw HTML """
+import os
+import sys
+from json import dumps, loads
+from hashlib import sha256
+from inspect import getmodule, getsource, ismodule
+from functools import lru_cache
+from sqlite3 import connect
+from requests_cache import CachedSession
+from cache_reader import CacheReader
+from document import EXTRACTOR_VERSION, ExtractedResponse, Serp, extract
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def source_modules(cls):
+    """ Modules of this package defining a solver class and its bases, and the package modules they use """
+    pending = [sys.modules[base.__module__] for base in cls.__mro__[:-1]]
+    modules = {}
+    while pending:
+        module = pending.pop()
+        filename = getattr(module, '__file__', None)
+        if module.__name__ in modules or not filename or os.path.dirname(os.path.abspath(filename)) != ROOT:
+            continue
+        modules[module.__name__] = module
+        for value in vars(module).values():
+            dependency = value if ismodule(value) else getmodule(value)
+            if dependency is not None:
+                pending.append(dependency)
+    return [modules[name] for name in sorted(modules)]
+
+
+@lru_cache(maxsize=None)
+def class_fingerprint(cls):
+    """ Digest of the source code of a solver class and the classes it inherits from, and of the package
+    modules they use for scoring, such as utils and document """
+    digest = sha256(str(EXTRACTOR_VERSION).encode('utf-8'))
+    for base in cls.__mro__[:-1]:
+        digest.update(getsource(base).encode('utf-8'))
+    for module in source_modules(cls):
+        digest.update(getsource(module).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def solver_fingerprint(solver):
+    """ Digest of a solver's code and settings, or None if its source code is not available """
+    try:
+        fingerprint = class_fingerprint(type(solver))
+    except (OSError, TypeError):
+        return None
+    settings = {name: getattr(solver, name) for name in dir(solver)
+                if not name.startswith('_') and isinstance(getattr(solver, name), (int, float, str))}
+    return sha256((fingerprint + repr(sorted(settings.items()))).encode('utf-8')).hexdigest()
+
+
+def inputs_digest(urls, answers):
+    """ Digest of the URLs and answers a solver scores """
+    return sha256(dumps([urls, answers], sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class PageMissing(LookupError):
+    """ Raised for a search page that is not in the response cache when fetching is turned off """
+
+
+class FeatureCache(object):
+    """ Extracted solver features of cached search pages keyed by solver, URL and extractor version.
+    Pages are only read from the response cache and extracted when their features are missing or stale.
+    Also keeps the matches each version of a solver scored for a question's URLs.
+    With fetch turned off the response cache is only read, and missing pages raise PageMissing """
+
+    def __init__(self, path='games/db/features.sqlite', session=None, reader=None, fetch=True):
+        self.conn = connect(path, timeout=30)
+        self.conn.execute('pragma journal_mode = wal')
+        self.conn.execute('create table if not exists features '
+                          '(solver text, url text, version integer, data text, primary key (solver, url))')
+        self.conn.execute('create table if not exists matches '
+                          '(solver text, fingerprint text, inputs text, data text, '
+                          'primary key (solver, fingerprint, inputs))')
+        self._session = session
+        self._reader = reader
+        self.fetch = fetch
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def reader(self):
+        """ Read-only response cache used when features are missing, opened on first use """
+        if self._reader is None:
+            self._reader = CacheReader()
+        return self._reader
+
+    @property
+    def session(self):
+        """ Cached session fetching pages missing from the response cache, opened on first use """
+        if self._session is None:
+            self._session = CachedSession('games/db/cache', allowable_codes=(200, 302, 304))
+        return self._session
+
+    def page(self, url):
+        """ Read a search page from the response cache, fetching and caching it if missing """
+        response = self.reader.get(url)
+        if response is None:
+            if not self.fetch:
+                raise PageMissing(url)
+            response = self.session.get(url)
+            self.reader.open()
+        return response
+
+    def get(self, solver, url):
+        """ Return a response with the features a solver reads from a URL's search page """
+        row = self.conn.execute('select data from features where solver = ? and url = ? and version = ?',
+                                (solver.__class__.__name__, url, EXTRACTOR_VERSION)).fetchone()
+        if row is not None:
+            self.hits += 1
+            data = loads(row[0])
+            return ExtractedResponse(data.pop('url'), Serp(**data))
+        self.misses += 1
+        response = self.page(url)
+        data = solver.features(extract(response, stop_ids=solver.stop_ids))
+        with self.conn:
+            self.conn.execute('insert or replace into features values (?, ?, ?, ?)', (
+                solver.__class__.__name__, url, EXTRACTOR_VERSION, dumps(dict(data, url=response.url))
+            ))
+        return ExtractedResponse(response.url, Serp(**data))
+
+    def get_matches(self, solver, urls, answers):
+        """ Return the matches saved for the current version of a solver scoring these URLs, or None """
+        fingerprint = solver_fingerprint(solver)
+        if fingerprint is None:
+            return None
+        row = self.conn.execute('select data from matches where solver = ? and fingerprint = ? and inputs = ?',
+                                (solver.__class__.__name__, fingerprint, inputs_digest(urls, answers))).fetchone()
+        return loads(row[0]) if row is not None else None
+
+    def put_matches(self, solver, urls, answers, matches):
+        """ Save the matches the current version of a solver scored for these URLs """
+        fingerprint = solver_fingerprint(solver)
+        if fingerprint is not None:
+            with self.conn:
+                self.conn.execute('insert or replace into matches values (?, ?, ?, ?)', (
+                    solver.__class__.__name__, fingerprint, inputs_digest(urls, answers), dumps(matches)
+                ))
+
+    def close(self):
+        """ Close the database connection """
+        self.conn.close()
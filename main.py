@@ -7,6 +7,9 @@ from utils import get_stats, generate_token
 import replay
 import cache
 import server
+import benchmark
+import capture
+import tune
 
 
 class Main(object):
@@ -19,11 +22,14 @@ class Main(object):
 
 Valid commands are:
    bot       {self.bot.run.__doc__}
+   bench     {benchmark.__doc__}
    cache     {cache.__doc__}
+   playback  {self.playback.__doc__}
    replay    {replay.__doc__}
    server    {server.__doc__}
    stats     {get_stats.__doc__}
-   token     {generate_token.__doc__}''',
+   token     {generate_token.__doc__}
+   tune      {tune.__doc__}''',
             prog='pipenv run'
         )
         self.parser.add_argument('command', help=argparse.SUPPRESS)
@@ -40,7 +46,20 @@ Valid commands are:
                                          prog=f'{self.parser.prog} bot')
         parser.add_argument('--test-server', help="Use local test websocket",
                             action='store_true')
+        parser.add_argument('--engine', help="Bot engine to run the game with",
+                            choices=['threaded', 'asyncio'], default='threaded')
+        parser.add_argument('--capture', help="Record raw socket frames to games/captures",
+                            action='store_true')
         args = vars(parser.parse_args(argv[2:]))
+        if args.get('engine') == 'asyncio':
+            # aiohttp is a dev package, so the asyncio engine is only imported when chosen
+            try:
+                import engine
+            except ImportError:
+                exit('Error: The asyncio engine needs aiohttp. Please run pipenv install --dev.')
+            self.bot = engine.AsyncHqTriviaBot()
+        if args.get('capture') is True:
+            self.bot.capture = capture.CaptureLog()
         if args.get('test_server', '') is True:
             self.bot.api_url = 'http://localhost:8732'
         self.bot.run()
@@ -55,6 +74,7 @@ Valid commands are:
 Valid cache commands are:
    prune       {cacher.prune.__doc__}
    refresh     {cacher.refresh.__doc__}
+   shard       {cacher.shard.__doc__}
    vacuum      {cacher.vacuum.__doc__}
    import_sql  {cacher.import_sql.__doc__}
    export      {cacher.export.__doc__}
@@ -66,6 +86,41 @@ Valid cache commands are:
             exit(1)
         getattr(cacher, args.operation)()
 
+    def bench(self):
+        """ Run performance benchmarks """
+        bencher = benchmark.Benchmark()
+        parser = argparse.ArgumentParser(
+            prog=f'{self.parser.prog} bench',
+            usage=f'''pipenv run bench <benchmark>
+
+Valid benchmarks are:
+   parse       {bencher.parse.__doc__}
+   extract     {bencher.extract.__doc__}
+   frames      {bencher.frames.__doc__}
+   export      {bencher.export.__doc__}
+''')
+        parser.add_argument('benchmark', help=argparse.SUPPRESS)
+        args = parser.parse_args(argv[2:3])
+        if not hasattr(bencher, args.benchmark):
+            parser.print_help()
+            exit(1)
+        getattr(bencher, args.benchmark)()
+
+    def playback(self):
+        """ Play captured socket frames into the bot and report handler latency """
+        parser = argparse.ArgumentParser(description=self.playback.__doc__,
+                                         prog=f'{self.parser.prog} playback')
+        parser.add_argument('capture', help="Path of a capture e.g. games/captures/<game>.log")
+        parser.add_argument('--speed', help="Multiple of the original speed, or 0 for as fast as possible",
+                            type=float, default=1.0)
+        args = vars(parser.parse_args(argv[2:]))
+        frames = capture.load_capture(args['capture'])
+        if not frames:
+            exit('Error: No frames found in capture %s.' % args['capture'])
+        player = capture.Playback(self.bot, frames)
+        player.play(args['speed'])
+        player.report()
+
     def server(self):
         """ Websocket server that simulates live games """
         parser = argparse.ArgumentParser(
@@ -77,13 +132,27 @@ Valid cache commands are:
         game = server.Server()
         game.run(**args)
 
-    @staticmethod
-    def replay():
+    def replay(self):
         """ Replay a game and generate report """
+        parser = argparse.ArgumentParser(description=self.replay.__doc__,
+                                         prog=f'{self.parser.prog} replay')
+        parser.add_argument('--workers', help="Number of processes to predict with, or 0 for one per CPU",
+                            type=int, default=1)
+        args = vars(parser.parse_args(argv[2:]))
         replayer = replay.Replayer()
-        replayer.play()
+        replayer.play(args['workers'])
         replayer.gen_report()
 
+    def tune(self):
+        """ Search solver weights for the best accuracy over saved games """
+        parser = argparse.ArgumentParser(description=self.tune.__doc__,
+                                         prog=f'{self.parser.prog} tune')
+        parser.add_argument('--extract', help="Extract answer counts again instead of using the saved ones",
+                            action='store_true')
+        parser.add_argument('--top', help="Number of weight combinations to report", type=int, default=10)
+        args = vars(parser.parse_args(argv[2:]))
+        tune.Tuner().run(**args)
+
     def stats(self):
         """ Query play stats for a given user """
         parser = argparse.ArgumentParser(description=get_stats.__doc__,
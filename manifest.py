@@ -0,0 +1,93 @@
+""" Manifest of the search URLs and cache keys needed by saved games """
+import os
+from glob import glob
+from json import load
+from sqlite3 import connect
+from requests import Request
+from shards import SHARD_SCHEMA
+
+SCHEMA = '''
+create table if not exists manifest_games (game text primary key, mtime real);
+create table if not exists manifest (game text, question_id integer, solver text, answer text, url text, key text);
+create index if not exists manifest_game on manifest (game);
+create index if not exists manifest_key on manifest (key);
+create index if not exists manifest_url on manifest (url);
+'''
+
+
+class Manifest(object):
+    """ Table in the cache database mapping game, question, solver and answer to URL and cache key.
+    Only games saved since the last update are rebuilt """
+
+    def __init__(self, db_path='games/db/cache.sqlite', games_glob='games/json/*.json'):
+        self.db_path = db_path
+        self.games_glob = games_glob
+        self.conn = connect(db_path)
+        self.conn.executescript(SCHEMA + SHARD_SCHEMA)
+
+    @staticmethod
+    def game_name(filename):
+        """ Name of a game from its file name """
+        return os.path.basename(filename).split('.')[0]
+
+    @staticmethod
+    def game_rows(game_name, game, session, solvers):
+        """ Manifest rows for every URL the solvers build for a game's questions """
+        keys = {}
+        rows = []
+        for turn in game.get('questions'):
+            for solver in solvers:
+                for answer_key, url in solver.build_urls(turn.get('question'), turn.get('answers')).items():
+                    if url not in keys:
+                        keys[url] = session.cache.create_key(session.prepare_request(Request('GET', url)))
+                    rows.append((game_name, turn.get('questionId'), solver.__class__.__name__,
+                                 answer_key, url, keys[url]))
+        return rows
+
+    def update(self, session, solvers):
+        """ Add games saved since the last update and remove deleted games, returning the number changed """
+        saved = {self.game_name(filename): (filename, os.path.getmtime(filename))
+                 for filename in glob(self.games_glob)}
+        known = dict(self.conn.execute('select game, mtime from manifest_games'))
+        changed = 0
+        with self.conn:
+            for game_name in set(known) - set(saved):
+                self.conn.execute('delete from manifest where game = ?', (game_name,))
+                self.conn.execute('delete from manifest_games where game = ?', (game_name,))
+                changed += 1
+            for game_name, (filename, mtime) in sorted(saved.items()):
+                if known.get(game_name) == mtime:
+                    continue
+                with open(filename) as file:
+                    game = load(file)
+                self.conn.execute('delete from manifest where game = ?', (game_name,))
+                self.conn.executemany('insert into manifest values (?, ?, ?, ?, ?, ?)',
+                                      self.game_rows(game_name, game, session, solvers))
+                self.conn.execute('insert or replace into manifest_games values (?, ?)', (game_name, mtime))
+                changed += 1
+        return changed
+
+    def games(self):
+        """ Names of every game in the manifest """
+        return [game for (game,) in self.conn.execute('select game from manifest_games order by game')]
+
+    def keys(self, game=None):
+        """ Set of cache keys for every game, or just one game """
+        if game is None:
+            return {key for (key,) in self.conn.execute('select distinct key from manifest')}
+        return {key for (key,) in self.conn.execute('select distinct key from manifest where game = ?', (game,))}
+
+    def urls(self):
+        """ Set of URLs for every game """
+        return {url for (url,) in self.conn.execute('select distinct url from manifest')}
+
+    def missing(self):
+        """ URLs whose cache keys are not in the cache responses table or a shard """
+        return [url for (url,) in self.conn.execute(
+            'select url from manifest where key not in (select key from responses) '
+            'and key not in (select key from shard_keys) group by key order by min(rowid)'
+        )]
+
+    def close(self):
+        """ Close the database connection """
+        self.conn.close()
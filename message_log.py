@@ -0,0 +1,86 @@
+""" Buffered socket message log with per game rotation """
+import os
+import gzip
+import shutil
+from time import monotonic
+from queue import Queue, Empty
+from threading import Thread
+
+
+class MessageLog(object):
+    """ Batches messages in memory and writes them from a background thread, flushing on size or time.
+    Each game is logged to its own segment, and closed segments are compressed """
+
+    def __init__(self, directory='./games/logs', segment='messages', max_pending=10000,
+                 flush_lines=200, flush_interval=1.0):
+        self.directory = os.path.abspath(directory)
+        self.segment = segment
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.dropped = 0
+        self._queue = Queue()
+        self._writer = Thread(target=self._write_behind, daemon=True)
+        self._writer.start()
+
+    @property
+    def path(self):
+        """ Path of the current segment """
+        return os.path.join(self.directory, '%s.log' % self.segment)
+
+    def write(self, line):
+        """ Queue a line without blocking, dropping it if the writer has fallen too far behind """
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+        else:
+            self._queue.put_nowait(line)
+
+    def rotate(self, segment):
+        """ Start logging to a new segment, compressing the current one.
+        Commands are never dropped, only lines count towards the pending limit, so this never blocks """
+        if segment != self.segment:
+            self._queue.put_nowait(('rotate', segment))
+
+    def close(self):
+        """ Write all queued lines and stop the background writer """
+        self._queue.put_nowait(('close', None))
+        self._writer.join()
+
+    def _flush(self, lines):
+        """ Append lines to the current segment """
+        if lines:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path, 'a') as file:
+                file.writelines(lines)
+            self.flushed += len(lines)
+            del lines[:]
+
+    def _compress(self):
+        """ Compress the current segment, appending to any earlier compressed part """
+        if os.path.isfile(self.path):
+            with open(self.path, 'rb') as source, gzip.open(self.path + '.gz', 'ab') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(self.path)
+
+    def _write_behind(self):
+        """ Collect queued lines and write them in batches """
+        lines = []
+        flush_at = monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(flush_at - monotonic(), 0))
+            except Empty:
+                item = None
+            if isinstance(item, str):
+                lines.append(item)
+                if len(lines) < self.flush_lines and monotonic() < flush_at:
+                    continue
+            self._flush(lines)
+            flush_at = monotonic() + self.flush_interval
+            if isinstance(item, tuple):
+                (command, segment) = item
+                self._compress()
+                if command == 'close':
+                    return
+                self.segment = segment
@@ -9,9 +9,10 @@ from utils import Colours
 class Question(object):
     """ An instance of a HQ Trivia question """
 
-    def __init__(self, is_replay=False, load_id=None, **kwargs):
+    def __init__(self, is_replay=False, load_id=None, store=None, **kwargs):
 
         self.is_replay = is_replay
+        self.store = store
         if load_id is not None:
             output_key = -1 if self.is_replay else 'questions'
             with open(self.game_path) as file:
@@ -50,8 +51,11 @@ class Question(object):
         """
         Checks most recently created results file, checks it for question with same id.
         If present, updates. If not, appends itself. File path used depends on
-        whether is_replay is True or False
+        whether is_replay is True or False. Questions from a live game store are saved to the store
         """
+        if self.store is not None:
+            self.store.save(self._dict_for_json())
+            return
 
         # last list in replay games or 'questions' key in live saved games
         output_key = -1 if self.is_replay else 'questions'
@@ -87,12 +91,14 @@ class Question(object):
         else:
             print(Colours.BOLD.value + Colours.FAIL.value + "Prediction Correct? No" + Colours.ENDC.value)
 
-    def add_prediction(self, prediction, confidence):
-        """ Add the prediction dict to the Question """
+    def add_prediction(self, prediction, confidence, solvers=None):
+        """ Add the prediction dict to the Question, recording the solvers that contributed """
         self.prediction = {
             'answer': prediction,
             'confidence': confidence
         }
+        if solvers is not None:
+            self.prediction['solvers'] = solvers
         self.save()
 
     def add_correct(self, correct):
@@ -108,4 +114,5 @@ class Question(object):
         output['questionNumber'] = output.pop('number', None)
         output['question'] = output.pop('text', None)
         output.pop('is_replay')
+        output.pop('store')
         return output
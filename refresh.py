@@ -0,0 +1,169 @@
+""" Refresh the search cache concurrently within a rate limit """
+import os
+from json import load, dump
+from threading import Event, Lock
+from collections import deque
+from time import monotonic
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from requests.exceptions import RequestException
+
+RATE_LIMITED = '/sorry/index?continue='
+
+
+class TokenBucket(object):
+    """ Lets requests through at rate per second on average, in bursts of up to burst requests """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = monotonic()
+        self._lock = Lock()
+
+    def pause(self, seconds):
+        """ Let no requests through for seconds """
+        with self._lock:
+            self.updated = max(self.updated, monotonic() + seconds)
+            self.tokens = 0
+
+    def paused(self):
+        """ Whether requests are paused """
+        return monotonic() < self.updated
+
+    def acquire(self, stop):
+        """ Block until a request may be sent, returning False if the stop event is set first """
+        while True:
+            with self._lock:
+                now = monotonic()
+                if now >= self.updated:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return True
+                    wait_time = (1 - self.tokens) / self.rate
+                else:
+                    wait_time = self.updated - now
+            if stop.wait(wait_time):
+                return False
+
+
+class Refresher(object):
+    """ Fetches URLs into a cached session from a bounded pool of workers behind a token bucket.
+    Rate limiting halves the rate and pauses with exponential backoff, and progress is checkpointed
+    so an interrupted refresh resumes with the URLs it had not fetched """
+
+    def __init__(self, session, rate=1.0, workers=4, checkpoint_path='games/db/refresh.json',
+                 backoff=30.0, max_backoff=960.0, max_rate_limits=6, checkpoint_every=10):
+        self.session = session
+        self.rate = rate
+        self.workers = workers
+        self.checkpoint_path = checkpoint_path
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_rate_limits = max_rate_limits
+        self.checkpoint_every = checkpoint_every
+        self.bucket = TokenBucket(rate)
+        self.stop = Event()
+        self.fetched = 0
+        self.rate_limits = 0
+        self.failed = []
+
+    def resume(self, urls):
+        """ Order URLs with those left by an interrupted refresh first """
+        if not os.path.isfile(self.checkpoint_path):
+            return list(urls)
+        with open(self.checkpoint_path) as file:
+            checkpoint = load(file)
+        urls = list(urls)
+        remaining = set(urls)
+        pending = [url for url in checkpoint['pending'] if url in remaining]
+        print('Resuming refresh with %s/%s URLs left from checkpoint' % (len(pending), len(checkpoint['pending'])))
+        started = set(pending)
+        return pending + [url for url in urls if url not in started]
+
+    def save_checkpoint(self, pending):
+        """ Atomically write the URLs not yet fetched """
+        temp_path = '%s.tmp' % self.checkpoint_path
+        with open(temp_path, 'w') as file:
+            dump({'pending': list(pending), 'fetched': self.fetched, 'failed': self.failed}, file)
+        os.replace(temp_path, self.checkpoint_path)
+
+    def fetch(self, url):
+        """ Fetch a URL when the bucket allows, returning False if it was rate limited or None if stopped """
+        if not self.bucket.acquire(self.stop):
+            return None
+        response = self.session.get(url)
+        if RATE_LIMITED in response.url:
+            self.session.cache.delete_url(url)
+            return False
+        return True
+
+    def rate_limited(self, consecutive):
+        """ Slow down after the nth consecutive rate limited response """
+        delay = min(self.backoff * 2 ** (consecutive - 1), self.max_backoff)
+        self.bucket.rate = max(self.bucket.rate / 2, self.rate / 64)
+        self.bucket.pause(delay)
+        print('Rate limited. Pausing for %.1fs, then fetching %.2f URLs/s' % (delay, self.bucket.rate))
+
+    def report(self, total, start):
+        """ Print progress and throughput """
+        elapsed = monotonic() - start
+        print('Cached %s/%s URLs (%.2f URLs/s, %s rate limited, %s failed)' % (
+            self.fetched, total, self.fetched / elapsed if elapsed else 0, self.rate_limits, len(self.failed)
+        ))
+
+    def run(self, urls):
+        """ Fetch every URL, returning True if all were fetched or False if the refresh stopped early
+        or any URL failed """
+        pending = deque(self.resume(urls))
+        total = len(pending)
+        in_flight = {}
+        consecutive = 0
+        completed = 0
+        start = monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while (pending or in_flight) and consecutive < self.max_rate_limits:
+                while pending and len(in_flight) < self.workers:
+                    url = pending.popleft()
+                    in_flight[executor.submit(self.fetch, url)] = url
+                (done, _) = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    url = in_flight.pop(future)
+                    try:
+                        fetched = future.result()
+                    except RequestException as err:
+                        print('ERROR: %s %s' % (url, err))
+                        self.failed.append(url)
+                        continue
+                    if fetched:
+                        consecutive = 0
+                        self.fetched += 1
+                        self.bucket.rate = min(self.bucket.rate * 1.25, self.rate)
+                    else:
+                        self.rate_limits += 1
+                        pending.appendleft(url)
+                        # Requests sent before the pause do not back off further
+                        if not self.bucket.paused():
+                            consecutive += 1
+                            self.rate_limited(consecutive)
+                    completed += 1
+                    if completed % self.checkpoint_every == 0:
+                        self.save_checkpoint(list(in_flight.values()) + list(pending) + self.failed)
+                        self.report(total, start)
+        finally:
+            self.stop.set()
+            executor.shutdown(wait=True)
+            # Failed URLs stay in the checkpoint so the next refresh retries them
+            left = list(in_flight.values()) + list(pending) + self.failed
+            if left:
+                self.save_checkpoint(left)
+            elif os.path.isfile(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            self.report(total, start)
+        if pending or in_flight:
+            print('Stopped after %s rate limited responses. Run cache refresh again to resume.' % consecutive)
+        elif self.failed:
+            print('%s URLs failed. Run cache refresh again to retry them.' % len(self.failed))
+        return not left
@@ -1,11 +1,47 @@
 """ Replay a game and generate report """
 from glob import glob
 from json import load, dump
+from io import StringIO
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
 import os
 import webbrowser
 from pandas import DataFrame
 from question import Question
 from bot import HqTriviaBot
+from features import FeatureCache, PageMissing
+
+
+_worker_bot = None
+PAGE_MISSING = 'page missing'
+
+
+class ReplayResult(object):
+    """ Stands in for a game store, keeping the result a replayed question saves """
+
+    def __init__(self):
+        self.saved = None
+
+    def save(self, saved):
+        """ Keep the saved question dict """
+        self.saved = saved
+
+
+def predict(question):
+    """ Predict a question in a replay worker process, returning its saved dict and console output.
+    Workers only read the response cache, so the saved dict is PAGE_MISSING if a page is not cached """
+    global _worker_bot # pylint: disable=global-statement
+    if _worker_bot is None:
+        _worker_bot = HqTriviaBot()
+        _worker_bot.features = FeatureCache(fetch=False)
+    question.store = ReplayResult()
+    output = StringIO()
+    with redirect_stdout(output):
+        try:
+            _worker_bot.prediction_time(question)
+        except PageMissing:
+            return PAGE_MISSING, ''
+    return question.store.saved, output.getvalue()
 
 
 class Replayer(object):
@@ -25,12 +61,54 @@ class Replayer(object):
         questions.sort(key=lambda q: q.number)
         return questions
 
-    def play(self):
-        """ Play all questions loaded from saved games """
-        bot = HqTriviaBot()
+    def play(self, workers=1):
+        """ Play all questions loaded from saved games, on a pool of worker processes if workers is not 1 """
         self.setup_output_file()
+        if workers != 1:
+            self.play_parallel(workers or None)
+            return
+        bot = HqTriviaBot()
         for question in self.questions:
             bot.prediction_time(question)
+        if bot.features is not None:
+            print('Feature cache: %s hits, %s misses' % (bot.features.hits, bot.features.misses))
+
+    def play_parallel(self, workers):
+        """ Predict questions across worker processes, saving results in question order.
+        Questions with pages missing from the response cache are predicted afterwards in this process, which
+        fetches the pages once no worker has the cache open, so their output is printed last """
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for saved, output in executor.map(predict, self.questions, chunksize=4):
+                print(output, end='')
+                results.append(saved)
+        missing = [index for index, saved in enumerate(results) if saved == PAGE_MISSING]
+        if missing:
+            print('Predicting %s questions with pages missing from the cache' % len(missing))
+            bot = HqTriviaBot()
+            for index in missing:
+                question = self.questions[index]
+                question.store = ReplayResult()
+                bot.prediction_time(question)
+                results[index] = question.store.saved
+        self.save_results(results)
+
+    @staticmethod
+    def save_results(results):
+        """ Add or update saved question dicts in the current replay, as each question would save itself """
+        with open('replay_results.json') as file:
+            output = load(file)
+        positions = {saved['questionId']: index for index, saved in enumerate(output[-1])}
+        for saved in results:
+            if saved is None:
+                continue
+            if saved['questionId'] in positions:
+                output[-1][positions[saved['questionId']]] = saved
+            else:
+                positions[saved['questionId']] = len(output[-1])
+                output[-1].append(saved)
+        with open('replay_results.json', 'w') as file:
+            dump(output, file, ensure_ascii=False, sort_keys=True, indent=4)
 
     @classmethod
     def setup_output_file(cls, mode='r+'):
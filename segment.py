@@ -0,0 +1,84 @@
+""" Compressed binary segments of cache rows, one per exported show """
+import os
+import gzip
+from json import load, dump
+from struct import Struct
+
+MAGIC = b'HQSEG1\n'
+TABLES = ['urls', 'responses']
+INDEX_PATH = 'games/db/segments.json'
+SEGMENT_EXTENSION = '.seg.gz'
+RECORD = Struct('>BcIcI')
+
+
+def encode(value):
+    """ Type tag and bytes of a key or value """
+    if isinstance(value, str):
+        return b's', value.encode('utf-8')
+    if value is None:
+        return b'n', b''
+    if isinstance(value, int):
+        return b'i', str(value).encode('ascii')
+    if isinstance(value, float):
+        return b'f', repr(value).encode('ascii')
+    return b'b', bytes(value)
+
+
+def decode(tag, data):
+    """ Key or value from its type tag and bytes """
+    if tag == b's':
+        return data.decode('utf-8')
+    if tag == b'n':
+        return None
+    if tag == b'i':
+        return int(data)
+    if tag == b'f':
+        return float(data)
+    return data
+
+
+def write_segment(path, rows):
+    """ Atomically write (table, key, value) rows to a compressed segment, returning the number written """
+    count = 0
+    temp_path = '%s.tmp' % path
+    with gzip.open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        for table, key, value in rows:
+            (key_tag, key_data) = encode(key)
+            (value_tag, value_data) = encode(value)
+            file.write(RECORD.pack(TABLES.index(table), key_tag, len(key_data), value_tag, len(value_data)))
+            file.write(key_data)
+            file.write(value_data)
+            count += 1
+    os.replace(temp_path, path)
+    return count
+
+
+def read_segment(path):
+    """ Yield (table, key, value) rows from a compressed segment """
+    with gzip.open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a cache segment' % path)
+        while True:
+            header = file.read(RECORD.size)
+            if not header:
+                return
+            (table, key_tag, key_length, value_tag, value_length) = RECORD.unpack(header)
+            key = decode(key_tag, file.read(key_length))
+            yield TABLES[table], key, decode(value_tag, file.read(value_length))
+
+
+def load_index(path=INDEX_PATH):
+    """ Load the index of exported segments by show """
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return load(file)
+
+
+def save_index(index, path=INDEX_PATH):
+    """ Atomically write the index of exported segments """
+    temp_path = '%s.tmp' % path
+    with open(temp_path, 'w') as file:
+        dump(index, file, sort_keys=True, indent=4)
+    os.replace(temp_path, path)
@@ -100,7 +100,7 @@ class GameServer:
         :param dict event: Event to broadcast
         """
         if self._players:
-            await asyncio.wait([player.send(dumps(event)) for player in self._players])
+            await asyncio.gather(*[player.send(dumps(event)) for player in self._players])
 
     async def host_game(self):
         """
@@ -170,7 +170,7 @@ class GameServer:
     def _unregister_player(self, player):
         self._players.remove(player)
 
-    async def _player_connection(self, socket, _path):
+    async def _player_connection(self, socket, _path=None):
         """
         Handles players connecting to the socket and registers them for broadcasts
         """
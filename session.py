@@ -0,0 +1,137 @@
+""" Long-lived HTTP session for live solver requests """
+from time import perf_counter
+from threading import Lock
+from concurrent.futures import Future, wait, as_completed
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3 import PoolManager
+from requests_futures.sessions import FuturesSession
+
+
+class ConnectionStats(object):
+    """ Counts of new connections (handshakes) and time spent setting them up """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.handshakes = 0
+        self.setup_time = 0.0
+
+    def record(self, seconds):
+        """ Record a single new connection """
+        with self._lock:
+            self.handshakes += 1
+            self.setup_time += seconds
+
+    def snapshot(self):
+        """ Return the current (handshakes, setup_time) totals """
+        with self._lock:
+            return self.handshakes, self.setup_time
+
+
+class CountingPoolManager(PoolManager):
+    """ Pool manager that times the connect (DNS, TCP and TLS) of every new connection """
+
+    def __init__(self, stats, *args, **kwargs):
+        self.stats = stats
+        super(CountingPoolManager, self).__init__(*args, **kwargs)
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super(CountingPoolManager, self)._new_pool(scheme, host, port, request_context)
+        new_conn = pool._new_conn
+
+        def counting_new_conn():
+            """ Wrap connect on each connection created by the pool """
+            conn = new_conn()
+            connect = conn.connect
+
+            def timed_connect():
+                """ Connect and record the time taken """
+                start = perf_counter()
+                connect()
+                self.stats.record(perf_counter() - start)
+            conn.connect = timed_connect
+            return conn
+
+        pool._new_conn = counting_new_conn
+        return pool
+
+
+class CountingAdapter(HTTPAdapter):
+    """ HTTP adapter using a CountingPoolManager """
+
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super(CountingAdapter, self).__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = CountingPoolManager(self.stats, num_pools=connections, maxsize=maxsize,
+                                               block=block, **pool_kwargs)
+
+
+class SearchSession(FuturesSession):
+    """ Pooled futures session kept open for the lifetime of a bot. Requests time out after timeout
+    seconds unless given their own, so stalled requests cannot hold on to the pool's workers """
+
+    def __init__(self, max_workers=10, timeout=None):
+        super(SearchSession, self).__init__(max_workers=max_workers)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        adapter = CountingAdapter(self.stats, pool_connections=max_workers, pool_maxsize=max_workers)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, *args, **kwargs): # pylint: disable=arguments-differ
+        """ Send a request in the background with the session's timeout """
+        kwargs.setdefault('timeout', self.timeout)
+        return super(SearchSession, self).request(*args, **kwargs)
+
+    def warm_up(self, urls, connections=None):
+        """ Open and keep alive connections to the hosts of the given URLs """
+        origins = set('{0.scheme}://{0.netloc}/'.format(urlparse(url)) for url in urls)
+        futures = [self.head(origin) for origin in origins
+                   for _ in range(connections or self.max_workers)]
+        (done, _) = wait(futures, self.timeout)
+        return sum(1 for future in done if not future.exception())
+
+
+class RequestRegistry(object):
+    """ Registry of in-flight requests so that each URL is only fetched once and
+    every caller asking for it shares the same response object """
+
+    def __init__(self, session):
+        self.session = session
+        self._lock = Lock()
+        self.requests = {}
+        self.shared = 0
+
+    def get(self, url):
+        """ Return the in-flight request for URL, sending it if not already sent """
+        with self._lock:
+            if url in self.requests:
+                self.shared += 1
+            else:
+                self.requests[url] = self.session.get(url)
+            return self.requests[url]
+
+
+def iter_completed(requests, timeout=None):
+    """ Yield (response, item) pairs from a dict of requests to items as each response arrives.
+    Requests may be futures or already completed responses (e.g. from a CachedSession).
+    A future that failed yields the exception it raised in place of a response.
+    Raises concurrent.futures.TimeoutError if futures are still pending after timeout seconds """
+    futures = {}
+    for request, item in requests.items():
+        if isinstance(request, Future):
+            futures[request] = item
+        else:
+            yield request, item
+    for future in as_completed(futures, timeout):
+        try:
+            response = future.result()
+        except Exception as err: # pylint: disable=broad-except
+            response = err
+        yield response, futures[future]
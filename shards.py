@@ -0,0 +1,121 @@
+""" Monthly shards of the response cache with a size cap """
+import os
+from glob import glob
+from sqlite3 import connect
+from urllib.request import pathname2url
+
+SHARD_DIR = 'games/db/shards'
+TABLES = ['urls', 'responses']
+SHARD_SCHEMA = '''
+create table if not exists shards (month text primary key, path text);
+create table if not exists shard_keys (key text primary key, month text);
+create index if not exists shard_keys_month on shard_keys (month);
+'''
+
+
+def shard_month(game):
+    """ Month shard of a game, from the date it starts with """
+    return game[:7]
+
+
+def readonly_uri(path):
+    """ URI opening a cache database immutable and read-only """
+    return 'file:%s?mode=ro&immutable=1' % pathname2url(os.path.abspath(path))
+
+
+class ShardedCache(object):
+    """ Moves cached responses for saved games out of the main cache into one SQLite file per month,
+    and deletes whole shards, least recently used or oldest first, to keep the cache under a size cap """
+
+    def __init__(self, db_path='games/db/cache.sqlite', directory=SHARD_DIR, max_bytes=None, eviction='lru'):
+        self.db_path = db_path
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.conn = connect(db_path, isolation_level=None)
+        self.conn.executescript(SHARD_SCHEMA)
+
+    def enable_auto_vacuum(self):
+        """ Let the main cache give back the pages freed by moving responses out. Changing the auto vacuum
+        mode of an existing database only takes effect after a full vacuum, so this is done once """
+        if self.conn.execute('pragma auto_vacuum').fetchone()[0] != 2:
+            self.conn.execute('pragma auto_vacuum = incremental')
+            self.conn.execute('vacuum')
+
+    def shard_path(self, month):
+        """ Path of the shard for a month """
+        return os.path.join(self.directory, '%s.sqlite' % month)
+
+    def split(self):
+        """ Move responses for games in the manifest to their month shards, returning the number moved """
+        os.makedirs(self.directory, exist_ok=True)
+        self.enable_auto_vacuum()
+        months = [month for (month,) in self.conn.execute(
+            'select distinct substr(game, 1, 7) from manifest where key in (select key from responses)'
+        )]
+        moved = 0
+        for month in months:
+            path = self.shard_path(month)
+            shard = connect(path)
+            shard.execute('pragma auto_vacuum = incremental')
+            for table in TABLES:
+                shard.execute('create table if not exists %s (key PRIMARY KEY, value)' % table)
+            shard.close()
+            self.conn.execute('attach database ? as shard', (path,))
+            try:
+                self.conn.execute('begin')
+                self.conn.execute('create temp table moving as select distinct key from manifest '
+                                  'where substr(game, 1, 7) = ? and key in (select key from responses)', (month,))
+                # Redirect mappings are moved with the responses they point to
+                for (table, column) in [('urls', 'value'), ('responses', 'key')]:
+                    self.conn.execute('insert or replace into shard.%s select * from main.%s '
+                                      'where %s in (select key from moving)' % (table, table, column))
+                    self.conn.execute('delete from main.%s where %s in (select key from moving)' % (table, column))
+                self.conn.execute('insert or replace into shard_keys select key, ? from moving', (month,))
+                self.conn.execute('insert or replace into shards values (?, ?)', (month, path))
+                moved += self.conn.execute('select count(*) from moving').fetchone()[0]
+                self.conn.execute('drop table moving')
+                self.conn.execute('commit')
+            except BaseException:
+                self.conn.execute('rollback')
+                raise
+            finally:
+                self.conn.execute('detach database shard')
+        # Each step of the pragma frees one page, and executescript steps it to completion
+        self.conn.executescript('pragma incremental_vacuum')
+        return moved
+
+    def shards(self):
+        """ (month, path) of every shard, in the order they would be evicted """
+        shards = [(month, path) for (month, path) in self.conn.execute('select month, path from shards order by month')
+                  if os.path.isfile(path)]
+        if self.eviction == 'lru':
+            shards.sort(key=lambda shard: os.path.getmtime(shard[1]))
+        return shards
+
+    def size(self):
+        """ Bytes used by the live pages of the main cache and the files of its shards """
+        (page_size,) = self.conn.execute('pragma page_size').fetchone()
+        (page_count,) = self.conn.execute('pragma page_count').fetchone()
+        (freelist_count,) = self.conn.execute('pragma freelist_count').fetchone()
+        paths = glob(os.path.join(self.directory, '*.sqlite'))
+        return (page_count - freelist_count) * page_size + sum(
+            os.path.getsize(path) for path in paths if os.path.isfile(path)
+        )
+
+    def evict(self):
+        """ Delete shards until the cache is under its size cap, returning the months evicted """
+        evicted = []
+        shards = self.shards()
+        while self.max_bytes is not None and shards and self.size() > self.max_bytes:
+            (month, path) = shards.pop(0)
+            with self.conn:
+                self.conn.execute('delete from shard_keys where month = ?', (month,))
+                self.conn.execute('delete from shards where month = ?', (month,))
+            os.remove(path)
+            evicted.append(month)
+        return evicted
+
+    def close(self):
+        """ Close the database connection """
+        self.conn.close()
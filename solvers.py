@@ -1,9 +1,12 @@
 """ Solvers for the HQ Trivia bot project """
 import re
-import sys
 from urllib.parse import quote_plus
-from bs4 import BeautifulSoup
-from utils import Colours, get_raw_words, get_significant_words
+from document import STAT_IDS, extract
+from utils import Colours, get_raw_words, get_answer_words, get_answers_counter
+
+
+class RateLimited(Exception):
+    """ Raised when a search returns Google's rate limiting page """
 
 
 class BaseSolver(object):
@@ -11,6 +14,7 @@ class BaseSolver(object):
 
     weight = 0
     service_url = None
+    stop_ids = None
 
     @staticmethod
     def build_queries(question_text, answers):
@@ -27,18 +31,15 @@ class BaseSolver(object):
 
         return urls
 
-    @staticmethod
-    def fetch_responses(urls, session):
-        """ fetch responses for solver URLs """
-        responses = {}
-        for answer_key, url in urls.items():
-            responses[answer_key] = session.get(url)
-        return responses
-
     def get_answer_matches(self, response, answer_key, answers, matches):
         """ get answer occurences for response """
         raise NotImplementedError()
 
+    @staticmethod
+    def features(serp):
+        """ The parts of an extracted search page read by the solver """
+        return {'results': serp.results, 'stats': serp.stats}
+
     def compute_confidence(self, matches, confidence):
         """ Calculate confidence for matches """
         total_matches = sum(matches.values())
@@ -55,18 +56,27 @@ class BaseSolver(object):
         comparison = min if ' NOT ' in question_text or ' NEVER ' in question_text else max
         return comparison(confidence, key=confidence.get)
 
+    @property
+    def name(self):
+        """ Display name of the solver """
+        return re.sub(r'(\w)([A-Z])', r'\1 \2', self.__class__.__name__)[:-7]
+
+    def score(self, response, answer_key, answers, matches):
+        """ Add answer matches for a single completed response """
+        if '/sorry/index?continue=' in response.url:
+            raise RateLimited(response.url)
+        return self.get_answer_matches(response, answer_key, answers, matches)
+
     def run(self, question_text, answers, responses, confidence):
         """ Run solver and return confidence """
 
-        print('\n%s: ' % (re.sub(r'(\w)([A-Z])', r'\1 \2', self.__class__.__name__)[:-7]))
+        print('\n%s: ' % self.name)
 
         matches = {'A': 0, 'B': 0, 'C': 0}
 
         for answer_key, response in responses.items():
             response = response.result() if hasattr(response, 'result') else response
-            if '/sorry/index?continue=' in response.url:
-                sys.exit('ERROR: Google rate limiting detected.')
-            matches = self.get_answer_matches(response, answer_key, answers, matches)
+            matches = self.score(response, answer_key, answers, matches)
 
         confidence = self.compute_confidence(matches, confidence)
         prediction = self.choose_answer(question_text, confidence)
@@ -92,31 +102,33 @@ class GoogleAnswerWordsSolver(BaseSolver):
         """
         return {'_': question_text}
 
+    @staticmethod
+    def features(serp):
+        """ The parts of an extracted search page read by the solver """
+        return {'results': serp.results}
+
+    @staticmethod
+    def count_answers(response, answers):
+        """ Count exact and partial occurrences of each answer in a response, before weighting """
+        # Search result descriptions, titles, quick answer card and related searches
+        counter = get_answers_counter(tuple(answers.values()))
+        results_counts = counter.count_all(get_raw_words(extract(response).results))
+        exact = {answer_key: results_counts[get_answer_words(answer)[0]] for answer_key, answer in answers.items()}
+        partial = {answer_key: sum(results_counts[word] for word in get_answer_words(answer)[1])
+                   for answer_key, answer in answers.items()}
+        return exact, partial
+
     def get_answer_matches(self, response, _answer_key, answers, matches):
         """ get answer occurrences for response """
-        results = ''
-        document = BeautifulSoup(response.text, "html5lib")
-        for element in document.find_all(class_='st'):
-            results += " " + element.text # Search result descriptions
-        for element in document.find_all(class_='r'):
-            results += " " + element.text # Search result titles
-        for element in document.find_all(class_='mod'):
-            results += " " + element.text # Quick answer card
-        for element in document.find_all(class_='brs_col'):
-            results += " " + element.text # Related searches
-        results_words = get_raw_words(results)
+        (exact, partial) = self.count_answers(response, answers)
         print('Exact matches: ')
-        for answer_key, answer in answers.items():
-            count = results_words.count(' {} '.format(get_raw_words(answer)))
-            matches[answer_key] += self.full_answer_weight * count
-            print('{}: {}'.format(answer_key, Colours.BOLD.value + str(count) + Colours.ENDC.value))
+        for answer_key in answers:
+            matches[answer_key] += self.full_answer_weight * exact[answer_key]
+            print('{}: {}'.format(answer_key, Colours.BOLD.value + str(exact[answer_key]) + Colours.ENDC.value))
         print('\nPartial matches: ')
-        for answer_key, answer in answers.items():
-            count = 0
-            for word in get_significant_words(get_raw_words(answer)):
-                count += results_words.count(' {} '.format(word))
-            matches[answer_key] += self.partial_answer_weight * count
-            print('{}: {}'.format(answer_key, Colours.BOLD.value + str(count) + Colours.ENDC.value))
+        for answer_key in answers:
+            matches[answer_key] += self.partial_answer_weight * partial[answer_key]
+            print('{}: {}'.format(answer_key, Colours.BOLD.value + str(partial[answer_key]) + Colours.ENDC.value))
         return matches
 
 
@@ -125,6 +137,7 @@ class GoogleResultsCountSolver(BaseSolver):
 
     weight = 100
     service_url = 'https://www.google.co.uk/search?pws=0&q={}'
+    stop_ids = STAT_IDS
 
     @staticmethod
     def build_queries(question_text, answers):
@@ -134,12 +147,17 @@ class GoogleResultsCountSolver(BaseSolver):
             queries[answer_key] = '%s "%s"' % (question_text, answer_value)
         return queries
 
+    @staticmethod
+    def features(serp):
+        """ The parts of an extracted search page read by the solver """
+        return {'stats': serp.stats}
+
     def get_answer_matches(self, response, answer_key, answers, matches):
         """ get answer occurences for response """
-        document = BeautifulSoup(response.text, "html5lib")
-        if getattr(document.find(id='topstuff'), 'text', '')[:16] != 'No results found':
-            if document.find(id='resultStats'):
-                results_count_text = document.find(id='resultStats').text.replace(',', '')
+        serp = extract(response, stop_ids=self.stop_ids)
+        if serp.topstuff[:16] != 'No results found':
+            if serp.result_stats is not None:
+                results_count_text = serp.result_stats.replace(',', '')
                 results_count = re.findall(r'\d+', results_count_text)
                 if results_count:
                     matches[answer_key] += int(results_count[0])
@@ -0,0 +1,131 @@
+""" In-memory store for live games with write-behind persistence """
+import os
+from queue import Queue
+from threading import Lock, Thread
+from json import load, loads, dump, dumps, JSONDecodeError
+from question import Question
+
+JOURNAL_DIR = './games/journal'
+MISSING = object()
+
+
+class GameStore(object):
+    """ Holds the questions of a live game by id. Changes are appended to a JSONL event journal
+    from a background thread, and compacted into the game file when the game ends """
+
+    def __init__(self, path, game, journal_path=None):
+        self.path = path
+        self.journal_path = journal_path or os.path.join(
+            JOURNAL_DIR, os.path.basename(path).replace('.json', '.jsonl')
+        )
+        self.game = game
+        self.questions = {question['questionId']: question for question in game['questions']}
+        self._lock = Lock()
+        self._events = Queue()
+        self._closed = False
+        self._writer = Thread(target=self._write_behind, daemon=True)
+        self._writer.start()
+
+    @classmethod
+    def open(cls, path, data, journal_path=None):
+        """ Recover a game from its journal, load a saved game, or start a new one from a gameStatus message """
+        store = cls(path, {
+            'showId': data.get('showId'),
+            'ts': data.get('ts'),
+            'prize': data.get('prize'),
+            'numCorrect': 0,
+            'questionCount': data.get('questionCount'),
+            'questions': [],
+        }, journal_path)
+        if os.path.isfile(store.journal_path):
+            store.recover()
+            return store
+        if os.path.isfile(path):
+            with open(path) as file:
+                store.game = load(file)
+            store.questions = {question['questionId']: question for question in store.game['questions']}
+        store.append('gameStatus', store.game)
+        return store
+
+    def recover(self):
+        """ Rebuild the game by replaying its journal, dropping a line left incomplete by a crash """
+        with open(self.journal_path, 'rb') as file:
+            journal = file.read()
+        complete = journal[:journal.rfind(b'\n') + 1]
+        if len(complete) != len(journal):
+            with open(self.journal_path, 'r+b') as file:
+                file.truncate(len(complete))
+        for line in complete.decode('utf-8').splitlines():
+            try:
+                event = loads(line)
+            except JSONDecodeError:
+                continue
+            if event['event'] == 'gameStatus':
+                self.game = event['data']
+                self.questions = {question['questionId']: question for question in self.game['questions']}
+            elif event['data']['questionId'] in self.questions:
+                self.questions[event['data']['questionId']].update(event['data'])
+            else:
+                self.questions[event['data']['questionId']] = event['data']
+                self.game['questions'].append(event['data'])
+
+    def get(self, question_id):
+        """ Return the saved Question with question_id, or None if not saved """
+        with self._lock:
+            question = self.questions.get(question_id)
+        return Question(store=self, **dict(question)) if question else None
+
+    def save(self, saved):
+        """ Add or update a saved question dict, journalling the changes in the background """
+        with self._lock:
+            stored = self.questions.get(saved['questionId'])
+            if stored is None:
+                stored = self.questions[saved['questionId']] = {'questionId': saved['questionId']}
+                self.game['questions'].append(stored)
+            changes = {key: value for key, value in saved.items() if stored.get(key, MISSING) != value}
+            stored.update(changes)
+        if self._closed:
+            self.compact()
+            return
+        for event in ['prediction', 'correct']:
+            if event in changes:
+                self.append(event, {'questionId': saved['questionId'], event: changes.pop(event)})
+        if changes:
+            self.append('question', dict(changes, questionId=saved['questionId']))
+
+    def append(self, event, data):
+        """ Queue an event to be appended to the journal """
+        self._events.put(dumps({'event': event, 'data': data}, ensure_ascii=False, sort_keys=True) + '\n')
+
+    def _write_behind(self):
+        """ Append queued events to the journal in batches """
+        while True:
+            lines = [self._events.get()]
+            while not self._events.empty():
+                lines.append(self._events.get())
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            with open(self.journal_path, 'a') as file:
+                file.writelines(line for line in lines if line is not None)
+                file.flush()
+                os.fsync(file.fileno())
+            if None in lines:
+                return
+
+    def compact(self):
+        """ Write the game file from the current state and remove the journal """
+        with self._lock:
+            output = dict(self.game, questions=[dict(question) for question in self.game['questions']])
+        temp_path = '%s.tmp' % self.path
+        with open(temp_path, 'w') as file:
+            dump(output, file, ensure_ascii=False, sort_keys=True, indent=4)
+        os.replace(temp_path, self.path)
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+    def close(self):
+        """ Write pending events, stop the background writer and compact the journal into the game file """
+        if not self._closed:
+            self._closed = True
+            self._events.put(None)
+            self._writer.join()
+            self.compact()
@@ -0,0 +1,198 @@
+""" Tests for the HqTriviaBot class """
+import gzip
+from json import dumps, load
+from time import monotonic
+from threading import Event
+from concurrent.futures import Future
+from unittest.mock import Mock, patch
+import pytest
+from solvers import BaseSolver
+from session import ConnectionStats
+from capture import CaptureLog, load_capture
+from tests.utils import generate_question
+import bot
+
+
+class FixedSolver(BaseSolver):
+    """ Solver giving every response a fixed number of matches for its answer """
+    weight = 100
+    service_url = 'https://search.local/{}'
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def build_queries(self, question_text, answers): # pylint: disable=arguments-differ
+        return {answer_key: self.prefix + answer for answer_key, answer in answers.items()}
+
+    def get_answer_matches(self, response, answer_key, answers, matches):
+        matches[answer_key] += response.matches
+        return matches
+
+
+def future_session(pending_prefix, failed_prefix=None):
+    """ Session returning completed futures, except for URLs containing pending_prefix,
+    and failed futures for URLs containing failed_prefix """
+    def get(url):
+        future = Future()
+        if failed_prefix and failed_prefix in url:
+            future.set_exception(ConnectionError('refused'))
+        elif pending_prefix not in url:
+            future.set_result(Mock(url=url, matches=len(url)))
+        return future
+    return Mock(get=get, stats=ConnectionStats())
+
+
+@patch('bot.webbrowser.open')
+@patch('question.Question.save')
+def test_prediction_deadline(_mock_save, _mock_browser):
+    """ Ensure a prediction is committed at the deadline using only solvers that completed """
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.solvers = [FixedSolver('fast'), FixedSolver('slow')]
+    trivia_bot.session = future_session('slow')
+    trivia_bot.deadline = 0.1
+    question = generate_question(is_replay=False)
+    trivia_bot.prediction_time(question)
+    assert question.prediction['solvers'] == ['FixedSolver']
+    assert question.prediction['answer'] == 'B'
+
+
+@patch('bot.webbrowser.open')
+@patch('question.Question.save')
+def test_prediction_failed_request(_mock_save, _mock_browser):
+    """ Ensure a failed request leaves its solver out of a prediction committed without waiting for the deadline """
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.solvers = [FixedSolver('fast'), FixedSolver('broken')]
+    trivia_bot.session = future_session('slow', failed_prefix='broken')
+    trivia_bot.deadline = 5
+    question = generate_question(is_replay=False)
+    cancelled = Future()
+    start = monotonic()
+    trivia_bot.prediction_time(question, start, cancelled)
+    assert monotonic() - start < 1
+    assert question.prediction['solvers'] == ['FixedSolver']
+    assert question.prediction['answer'] == 'B'
+
+
+class LimitedSolver(FixedSolver):
+    """ Solver whose searches are answered with Google's rate limiting page """
+    service_url = 'https://www.google.co.uk/sorry/index?continue={}'
+
+
+@patch('bot.webbrowser.open')
+@patch('question.Question.save')
+def test_prediction_rate_limited(_mock_save, _mock_browser):
+    """ Ensure a rate limited solver is dropped from the prediction and the bot stops on the next frame """
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.solvers = [FixedSolver('fast'), LimitedSolver('limited')]
+    trivia_bot.session = future_session('slow')
+    trivia_bot.deadline = 5
+    question = generate_question(is_replay=False)
+    trivia_bot.prediction_time(question)
+    assert question.prediction['solvers'] == ['FixedSolver']
+    assert trivia_bot.rate_limited
+    web_socket = Mock()
+    trivia_bot.on_message(web_socket, dumps({'type': 'interaction', 'metadata': {}}))
+    assert web_socket.close.called
+    assert trivia_bot.broadcast_ended
+
+
+@pytest.fixture
+def games_dir(tmp_path, monkeypatch):
+    """ Run in an empty directory with a games folder for the message log """
+    (tmp_path / 'games').mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def question_frame(question_id):
+    """ Socket frame for a question """
+    return dumps({'type': 'question', 'questionId': question_id, 'questionNumber': question_id,
+                  'question': 'Which is fastest?', 'category': 'Nature',
+                  'answers': [{'text': 'Cheetah'}, {'text': 'Badger'}, {'text': 'Giraffe'}]})
+
+
+@pytest.mark.usefixtures('games_dir')
+@patch('bot.HqTriviaBot.game_summary')
+def test_frames_consumed_during_prediction(mock_game_summary):
+    """ Ensure frames keep being handled on the socket thread while a prediction is running """
+    started, release = Event(), Event()
+
+    def slow_prediction(*_args):
+        """ Prediction that blocks until released """
+        started.set()
+        release.wait(5)
+
+    trivia_bot = bot.HqTriviaBot()
+    with patch.object(trivia_bot, 'prediction_time', side_effect=slow_prediction):
+        trivia_bot.on_message(Mock(), question_frame(1))
+        assert started.wait(5)
+        for _ in range(50):
+            trivia_bot.on_message(Mock(), dumps({'type': 'interaction', 'metadata': {}}))
+        trivia_bot.on_message(Mock(), dumps({'type': 'gameSummary', 'winners': []}))
+        assert mock_game_summary.called
+        assert not trivia_bot.dispatcher.prediction.done()
+        release.set()
+    trivia_bot.dispatcher.shutdown()
+
+
+@pytest.mark.usefixtures('games_dir')
+@patch('bot.webbrowser.open')
+@patch('question.Question.save')
+def test_new_question_cancels_prediction(_mock_save, _mock_browser):
+    """ Ensure a newer question cancels the in flight prediction for the previous one """
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.solvers = [FixedSolver('fast'), FixedSolver('slow')]
+    trivia_bot.session = future_session('slow')
+    trivia_bot.deadline = 1
+    trivia_bot.on_message(Mock(), question_frame(1))
+    first = trivia_bot.dispatcher.prediction
+    trivia_bot.on_message(Mock(), question_frame(2))
+    second = trivia_bot.dispatcher.prediction
+    assert first.cancelled() or first.result(5) is None
+    assert second.result(5) is not None
+    trivia_bot.dispatcher.shutdown()
+
+
+@patch('bot.webbrowser.open')
+def test_game_files_written_off_socket_thread(_mock_browser, games_dir): # pylint: disable=redefined-outer-name
+    """ Ensure game stores are opened on the dispatcher and written when the broadcast ends """
+    (games_dir / 'games' / 'json').mkdir()
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.solvers = [FixedSolver('fast')]
+    trivia_bot.session = future_session('slow')
+    release = Event()
+    trivia_bot.dispatcher.submit(release.wait, 5)
+    web_socket = Mock()
+    trivia_bot.on_message(web_socket, dumps({'type': 'gameStatus', 'showId': 3701, 'ts': '2018-02-25T20:00:00.000Z'}))
+    trivia_bot.on_message(web_socket, question_frame(1))
+    assert trivia_bot.current_game == '2018-02-25-game-3701'
+    assert trivia_bot.store is None
+    release.set()
+    trivia_bot.dispatcher.prediction.result(5)
+    trivia_bot.on_message(web_socket, dumps({'type': 'broadcastEnded'}))
+    trivia_bot.dispatcher.shutdown()
+    assert web_socket.close.called
+    with open(str(games_dir / 'games' / 'json' / '2018-02-25-game-3701.json')) as file:
+        saved = load(file)
+    assert [question['prediction']['solvers'] for question in saved['questions']] == [['FixedSolver']]
+
+
+def test_message_log_opened_with_socket():
+    """ Ensure a bot only starts a message log writer when a socket opens """
+    trivia_bot = bot.HqTriviaBot()
+    assert trivia_bot.message_log is None
+    trivia_bot.on_message(Mock(), dumps({'type': 'gameSummary', 'winners': []}))
+    trivia_bot.shutdown()
+
+
+def test_shutdown_closes_logs(games_dir): # pylint: disable=redefined-outer-name
+    """ Ensure shutting down writes and compresses the message and capture logs of the last game """
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.capture = CaptureLog()
+    trivia_bot.open_log()
+    trivia_bot.rotate_game({'ts': '2018-02-25T20:00:00.000Z', 'showId': 3701})
+    trivia_bot.on_message(Mock(), dumps({'type': 'gameSummary', 'winners': []}))
+    trivia_bot.shutdown()
+    with gzip.open(str(games_dir / 'games' / 'logs' / '2018-02-25-game-3701.log.gz'), 'rt') as file:
+        assert 'gameSummary' in file.read()
+    assert load_capture(str(games_dir / 'games' / 'captures' / '2018-02-25-game-3701.log'))
@@ -0,0 +1,52 @@
+""" Tests for importing cache dumps """
+import os
+from sqlite3 import connect, OperationalError
+import pytest
+from cache import Cache
+from segment import write_segment
+
+
+def write_dump(directory, name, key):
+    """ Write a legacy SQL dump with one response """
+    with open(str(directory / name), 'w') as file:
+        file.write('BEGIN TRANSACTION;\n'
+                   'CREATE TABLE IF NOT EXISTS responses (key PRIMARY KEY, value);\n'
+                   "INSERT OR IGNORE INTO \"responses\" VALUES('%s','multi\nline;');\n"
+                   'COMMIT;\n' % key)
+
+
+def test_import_skips_applied_dumps(tmp_path, capsys):
+    """ Ensure dumps are imported once and imported again only when their contents change """
+    write_dump(tmp_path, 'first.sql', 'a')
+    write_segment(str(tmp_path / 'second.seg.gz'), [('responses', 'b', b'\x00')])
+    db_path = str(tmp_path / 'cache.sqlite')
+
+    Cache.import_sql(db_path, str(tmp_path))
+    Cache.import_sql(db_path, str(tmp_path))
+    os.utime(str(tmp_path / 'first.sql'), (1000, 1000))
+    Cache.import_sql(db_path, str(tmp_path))
+    write_dump(tmp_path, 'first.sql', 'c')
+    Cache.import_sql(db_path, str(tmp_path))
+    assert [line for line in capsys.readouterr().out.splitlines() if line.startswith('Imported')] == [
+        'Imported 2/2 dumps', 'Imported 0/2 dumps', 'Imported 0/2 dumps', 'Imported 1/2 dumps'
+    ]
+    conn = connect(db_path)
+    assert list(conn.execute('select * from responses order by key')) == [
+        ('a', 'multi\nline;'), ('b', b'\x00'), ('c', 'multi\nline;')
+    ]
+    assert conn.execute('pragma journal_mode').fetchone() == ('delete',)
+    conn.close()
+    assert not os.path.exists(db_path + '-wal')
+
+
+def test_import_rolls_back_on_error(tmp_path):
+    """ Ensure a bad dump leaves no dumps imported """
+    write_dump(tmp_path, 'first.sql', 'a')
+    (tmp_path / 'second.sql').write_text('INSERT INTO missing VALUES(1);\n')
+    db_path = str(tmp_path / 'cache.sqlite')
+    with pytest.raises(OperationalError):
+        Cache.import_sql(db_path, str(tmp_path))
+    conn = connect(db_path)
+    assert list(conn.execute('select * from responses')) == []
+    assert list(conn.execute('select * from imported_dumps')) == []
+    conn.close()
@@ -0,0 +1,41 @@
+""" Tests for socket frame capture and playback """
+from json import dumps, loads
+from unittest.mock import patch
+from capture import CaptureLog, Playback, load_capture, load_captures
+from tests.test_bot import question_frame
+import bot
+
+
+def test_capture_round_trip(tmp_path):
+    """ Ensure captured frames are loaded back with their arrival times after compression """
+    capture_log = CaptureLog(directory=str(tmp_path), flush_interval=0.01)
+    capture_log.rotate('2018-02-25-game-3701')
+    capture_log.record('{"type": "interaction"}', 10.5)
+    capture_log.record('42["message", "é"]', 11.25)
+    capture_log.close()
+    assert load_capture(str(tmp_path / '2018-02-25-game-3701.log')) == [
+        (10.5, '{"type": "interaction"}'), (11.25, '42["message", "é"]')
+    ]
+    assert load_captures(str(tmp_path)) == load_capture(str(tmp_path / '2018-02-25-game-3701.log'))
+
+
+@patch('bot.HqTriviaBot.game_summary')
+def test_playback_reports_latency(_mock_game_summary, tmp_path):
+    """ Ensure every frame is played into the bot and latency and backlog are recorded """
+    frames = [
+        (100.0, dumps({'type': 'gameStatus', 'showId': 3701, 'ts': '2018-02-25T20:00:00.000Z'})),
+        (100.01, dumps({'type': 'interaction', 'metadata': {'message': 'hi'}})),
+        (100.02, question_frame(1)),
+        (100.03, dumps({'type': 'broadcastEnded'})),
+        (100.04, dumps({'type': 'interaction', 'metadata': {'message': 'after'}})),
+    ]
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.session = None
+    player = Playback(trivia_bot, frames, directory=str(tmp_path))
+    assert player.play(speed=None) == 4
+    assert len(player.handler_latency) == len(player.latency) == len(player.backlog) == 4
+    assert player.backlog[0] == 4
+    assert all(end_to_end >= handler for end_to_end, handler in zip(player.latency, player.handler_latency))
+    (saved,) = list((tmp_path / 'json').iterdir())
+    assert loads(saved.read_text())['questions'][0]['prediction']['solvers'] == []
+    player.report()
@@ -0,0 +1,28 @@
+""" Tests for socket frame dispatch """
+from json import dumps
+from unittest.mock import patch
+import pytest
+import dispatch
+
+
+@pytest.mark.parametrize("message, expected_type, decoded", [
+    (dumps({'type': 'interaction', 'metadata': {'message': '"type":"question"'}}), 'interaction', False),
+    (dumps({'type': 'broadcastStats', 'viewerCounts': {}}), 'broadcastStats', False),
+    ('42' + dumps({'type': 'question', 'question': 'Fastest?'}), 'question', True),
+    (dumps({'type': 'questionSummary', 'answerCounts': []}), 'questionSummary', True),
+    (dumps({'metadata': {'type': 'question'}, 'type': 'interaction'}), 'interaction', True),
+    ('no frame', None, False),
+])
+def test_read_frame(message, expected_type, decoded):
+    """ Ensure only frames that may have handlers are decoded """
+    with patch('dispatch.decode', wraps=dispatch.decode) as mock_decode:
+        (message_type, data) = dispatch.read_frame(message)
+    assert message_type == expected_type
+    assert mock_decode.called is decoded
+    assert (data is not None) is decoded
+
+
+def test_read_frame_bad_json():
+    """ Ensure bad JSON in a handled frame raises ValueError """
+    with pytest.raises(ValueError):
+        dispatch.read_frame('{"type": "question", "answers": [')
@@ -0,0 +1,62 @@
+""" Tests for the streaming search page extractor """
+import os
+from bs4 import BeautifulSoup
+import pytest
+from benchmark import Benchmark
+import document
+
+
+def assert_matches_soup(html):
+    """ Assert the streaming extractor reads the same snippet and stat text from a page as html5lib """
+    soup = BeautifulSoup(html, 'html5lib')
+    serp = document.SerpExtractor().extract(html)
+    assert serp.results == ''.join(' ' + element.text for name in document.SNIPPET_CLASSES
+                                   for element in soup.find_all(class_=name))
+    assert serp.stats == {stat_id: soup.find(id=stat_id).text for stat_id in document.STAT_IDS
+                          if soup.find(id=stat_id)}
+
+
+def test_extract_matches_soup():
+    """ Ensure the streaming extractor returns the same text as BeautifulSoup """
+    assert_matches_soup('''<html><body><div id="resultStats">About 1,230 results<nobr> (0.4 seconds)</nobr></div>
+    <div class="g"><h3 class="r"><a>The <b>Cheetah</b> &amp; co</a></h3><span class="st">Fastest<br>animal</span></div>
+    <div class="mod"><p>Quick answer <span class="st">nested</span><p>unclosed</div>
+    <div class="brs_col st">both</div><!-- <div class="st">comment</div> --></body></html>''')
+
+
+@pytest.mark.parametrize("html", [
+    '<ul><li class="st">one<li class="st">two</ul>',
+    '<ul><li class="st">one<div><li class="st">two</div></ul>',
+    '<ul><li class="st">one<ul><li class="st">two</ul>three</ul>',
+    '<table><tr><td class="r">x<td class="r">y</table>',
+    '<table><tr><td class="st">a<tr><td class="st">b<tbody><tr><td class="st">c</table>',
+    '<table><tr><td class="st">a<table><tr><td class="st">b</table>c<td class="st">d</table>',
+    '<p class="st">one<p class="st">two',
+    '<p class="st">one<div class="r">two</div>',
+    '<p class="st">one<hr>two',
+    '<h3 class="r">one<h3 class="r">two',
+    '<dl><dt class="st">one<dd class="st">two</dl>',
+    '<select><option class="st">one<option class="st">two<optgroup><option class="st">three</select>',
+    '<div class="st"/>inside<span class="r">x</span></div>after',
+    '<div id="resultStats">About 5 <p>results<p class="st">x</div>',
+])
+def test_extract_implied_end_tags(html):
+    """ Ensure elements closed implicitly by a sibling start tag are closed as html5lib closes them """
+    assert_matches_soup('<!DOCTYPE html>' + html)
+
+
+@pytest.mark.skipif(not os.path.isfile('games/db/cache.sqlite'), reason='No local cache of recorded pages')
+def test_extract_matches_soup_on_recorded_pages():
+    """ Ensure the streaming extractor matches html5lib on every recorded search page """
+    for text in Benchmark.cached_pages():
+        assert_matches_soup(text)
+
+
+def test_extract_stops_early():
+    """ Ensure extraction stops once the stop ids have been read """
+    html = '<div id="topstuff"></div><div id="resultStats">About 5 results</div>' + \
+           '<span class="st">snippet</span>' * 10000
+    serp = document.SerpExtractor(document.STAT_IDS).extract(html)
+    assert serp.result_stats == 'About 5 results'
+    assert serp.complete is False
+    assert len(serp.snippets['st']) < 10000
@@ -0,0 +1,81 @@
+""" End to end tests for the asyncio bot engine against the local game server """
+import asyncio
+from glob import glob
+from json import dump, load
+from aiohttp import ClientSession, web
+from solvers import GoogleResultsCountSolver
+from capture import CaptureLog, load_captures
+from tests.utils import generate_game
+import engine
+import server
+
+SEARCH_PORT = 8733
+
+
+class LocalResultsCountSolver(GoogleResultsCountSolver):
+    """ Results count solver searching a local stand-in search server """
+    service_url = 'http://127.0.0.1:%s/search?q={}' % SEARCH_PORT
+
+
+async def serve_search(request):
+    """ Stand-in search page with more results for the first answer """
+    count = '1,000' if 'First Answer' in request.query.get('q', '') else '10'
+    return web.Response(text='<div id="resultStats">About %s results</div><div id="topstuff"></div>' % count,
+                        content_type='text/html')
+
+
+async def play_local_game(trivia_bot):
+    """ Run the game server, a search server and the bot until the game ends """
+    loop = asyncio.get_event_loop()
+    search_server = await loop.create_server(web.Server(serve_search), '127.0.0.1', SEARCH_PORT)
+    game_server = asyncio.ensure_future(server.WebServer('3701').run())
+    async with ClientSession() as client:
+        trivia_bot.client = client
+        socket_url = None
+        while not socket_url:
+            await asyncio.sleep(0.1)
+            socket_url = await trivia_bot.get_socket_url_async(trivia_bot.headers)
+        await trivia_bot.play(socket_url)
+    await game_server
+    search_server.close()
+    await search_server.wait_closed()
+
+
+def test_engine_plays_local_game(tmp_path, monkeypatch):
+    """ Ensure the asyncio engine captures, predicts and saves every question of a simulated game """
+    (tmp_path / 'games' / 'json').mkdir(parents=True)
+    game = generate_game(show_id=3701, correct='A')
+    game['questions'] = game['questions'][:2]
+    with open(str(tmp_path / 'games' / 'json' / '2018-02-25-game-3701.json'), 'w') as file:
+        dump(game, file)
+    monkeypatch.chdir(tmp_path)
+    opened = []
+    monkeypatch.setattr(engine.webbrowser, 'open', opened.append)
+    real_sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, 'sleep', lambda delay, *args, **kwargs: real_sleep(min(delay, 0.05), *args, **kwargs))
+
+    trivia_bot = engine.AsyncHqTriviaBot()
+    trivia_bot.api_url = 'http://localhost:%s' % server.WebServer.PORT
+    trivia_bot.config.read_dict({'Auth': {'user_id': '1', 'bearer_token': 'token'}})
+    trivia_bot.solvers = [LocalResultsCountSolver()]
+    trivia_bot.capture = CaptureLog()
+    trivia_bot.open_browser = False
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(asyncio.wait_for(play_local_game(trivia_bot), 30))
+    finally:
+        loop.close()
+    trivia_bot.capture.close()
+
+    (saved_path,) = [path for path in glob('games/json/*.json') if path.endswith('3701.local.json')]
+    with open(saved_path) as file:
+        saved = load(file)
+    assert len(saved['questions']) == 2
+    for question in saved['questions']:
+        assert question['prediction']['answer'] == 'A'
+        assert question['prediction']['solvers'] == ['LocalResultsCountSolver']
+        assert question['correct'] == 'A'
+    assert not opened
+    assert sum(1 for (_, frame) in load_captures() if '"question"' in frame) == 2
@@ -0,0 +1,110 @@
+""" Tests for the extracted feature cache """
+from unittest.mock import Mock, patch
+import pytest
+from solvers import BaseSolver, GoogleAnswerWordsSolver, GoogleResultsCountSolver
+from tests.utils import generate_question
+from document import extract
+from features import FeatureCache
+import features
+import bot
+
+PAGE = ('<div id="resultStats">About 1,200 results</div><div id="topstuff"></div>'
+        '<span class="st">Cheetahs are the fastest</span>')
+
+
+def test_features_read_from_cache(tmp_path, monkeypatch):
+    """ Ensure solver features are stored once, read back without the page, and extracted again for a new version """
+    path = str(tmp_path / 'features.sqlite')
+    session = Mock(get=Mock(side_effect=lambda url: Mock(url=url + '&redirected', text=PAGE)))
+    (words_solver, count_solver) = (GoogleAnswerWordsSolver(), GoogleResultsCountSolver())
+    reader = Mock(get=Mock(return_value=None))
+    feature_cache = FeatureCache(path, session, reader)
+    feature_cache.get(words_solver, 'https://search/words')
+    feature_cache.get(count_solver, 'https://search/count')
+    feature_cache.close()
+
+    feature_cache = FeatureCache(path, session, reader)
+    words = feature_cache.get(words_solver, 'https://search/words')
+    count = feature_cache.get(count_solver, 'https://search/count')
+    assert (session.get.call_count, feature_cache.hits, feature_cache.misses) == (2, 2, 0)
+    assert words.url == 'https://search/words&redirected'
+    page = extract(Mock(text=PAGE))
+    assert (extract(words).results, extract(words).stats) == (page.results, {})
+    assert (extract(count).results, extract(count).stats) == ('', page.stats)
+    assert count_solver.score(count, 'A', {}, {'A': 0}) == {'A': 1200}
+
+    monkeypatch.setattr(features, 'EXTRACTOR_VERSION', features.EXTRACTOR_VERSION + 1)
+    feature_cache.get(words_solver, 'https://search/words')
+    assert (session.get.call_count, feature_cache.misses) == (3, 1)
+    assert reader.get.call_count == reader.open.call_count == 3
+    feature_cache.close()
+
+
+def test_features_read_pages_from_reader(tmp_path):
+    """ Ensure pages in the read-only cache are extracted without opening a cached session """
+    reader = Mock(get=Mock(return_value=Mock(url='https://search/count', text=PAGE)))
+    feature_cache = FeatureCache(str(tmp_path / 'features.sqlite'), reader=reader)
+    count = feature_cache.get(GoogleResultsCountSolver(), 'https://search/count')
+    assert extract(count).result_stats == 'About 1,200 results'
+    assert feature_cache._session is None # pylint: disable=protected-access
+    assert not reader.open.called
+    feature_cache.close()
+
+
+class SnippetLengthSolver(BaseSolver):
+    """ Solver scoring the length of the snippet text for each answer """
+    weight = 100
+    service_url = 'https://search.local/{}'
+    scored = []
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+    def build_queries(self, question_text, answers): # pylint: disable=arguments-differ
+        return {answer_key: self.prefix + answer for answer_key, answer in answers.items()}
+
+    def get_answer_matches(self, response, answer_key, answers, matches):
+        SnippetLengthSolver.scored.append(answer_key)
+        matches[answer_key] += len(extract(response).results) * (2 if answer_key == self.prefix else 1)
+        return matches
+
+
+@patch('question.Question.save')
+def test_replay_reuses_unchanged_solver_matches(_mock_save, tmp_path):
+    """ Ensure replays only score solvers whose code, settings or inputs changed """
+    session = Mock(get=Mock(side_effect=lambda url: Mock(url=url, text=PAGE)))
+    trivia_bot = bot.HqTriviaBot()
+    trivia_bot.features = FeatureCache(str(tmp_path / 'features.sqlite'), session, Mock(get=Mock(return_value=None)))
+    trivia_bot.solvers = [SnippetLengthSolver('A'), SnippetLengthSolver('B')]
+    predictions = []
+    for _ in range(2):
+        question = generate_question(is_replay=True)
+        trivia_bot.prediction_time(question)
+        predictions.append(question.prediction)
+    assert (len(SnippetLengthSolver.scored), session.get.call_count) == (6, 6)
+    assert predictions[0] == predictions[1]
+
+    trivia_bot.solvers[1].weight = 300
+    question = generate_question(is_replay=True)
+    trivia_bot.prediction_time(question)
+    assert (len(SnippetLengthSolver.scored), session.get.call_count) == (9, 6)
+    assert question.prediction['solvers'] == ['SnippetLengthSolver', 'SnippetLengthSolver']
+    assert question.prediction['answer'] == 'B'
+    trivia_bot.features.close()
+
+
+def test_features_without_fetching(tmp_path):
+    """ Ensure a page missing from the read-only cache raises instead of being fetched """
+    session = Mock()
+    feature_cache = FeatureCache(str(tmp_path / 'features.sqlite'), session=session,
+                                 reader=Mock(get=Mock(return_value=None)), fetch=False)
+    with pytest.raises(features.PageMissing):
+        feature_cache.get(GoogleResultsCountSolver(), 'https://search/count')
+    assert not session.get.called
+
+
+def test_fingerprint_covers_scoring_modules():
+    """ Ensure solver fingerprints include the package modules the solvers score with """
+    assert [module.__name__ for module in features.source_modules(GoogleAnswerWordsSolver)] == [
+        'document', 'solvers', 'utils'
+    ]
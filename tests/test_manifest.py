@@ -0,0 +1,50 @@
+""" Tests for the cache manifest """
+import os
+from json import dump
+from sqlite3 import connect
+from unittest.mock import Mock
+from solvers import GoogleAnswerWordsSolver, GoogleResultsCountSolver
+from tests.utils import generate_game
+from manifest import Manifest
+
+
+def key_session():
+    """ Session whose cache key for a request is its URL """
+    return Mock(prepare_request=lambda request: request,
+                cache=Mock(create_key=lambda request: 'key:' + request.url))
+
+
+def save_game(tmp_path, show_id, mtime):
+    """ Save a generated game with a given modification time """
+    filename = str(tmp_path / ('2018-02-25-game-%s.json' % show_id))
+    with open(filename, 'w') as file:
+        dump(generate_game(show_id=show_id), file)
+    os.utime(filename, (mtime, mtime))
+    return filename
+
+
+def test_manifest_updates_incrementally(tmp_path):
+    """ Ensure only new, changed and deleted games are updated and URLs map to cache keys """
+    db_path = str(tmp_path / 'cache.sqlite')
+    connect(db_path).execute('create table responses (key PRIMARY KEY, value)').connection.commit()
+    save_game(tmp_path, 1, 1000)
+    second = save_game(tmp_path, 2, 1000)
+    solvers = [GoogleAnswerWordsSolver(), GoogleResultsCountSolver()]
+    manifest = Manifest(db_path, str(tmp_path / '*.json'))
+    assert manifest.update(key_session(), solvers) == 2
+    assert manifest.update(key_session(), solvers) == 0
+    assert manifest.games() == ['2018-02-25-game-1', '2018-02-25-game-2']
+    urls = manifest.urls()
+    assert manifest.keys() == {'key:' + url for url in urls}
+    assert len(manifest.missing()) == len(urls)
+
+    os.utime(second, (2000, 2000))
+    os.remove(str(tmp_path / '2018-02-25-game-1.json'))
+    assert manifest.update(key_session(), solvers) == 2
+    assert manifest.games() == ['2018-02-25-game-2']
+    cached = sorted(manifest.keys('2018-02-25-game-2'))[0]
+    manifest.conn.execute('insert into responses values (?, ?)', (cached, ''))
+    missing_keys = {'key:' + url for url in manifest.missing()}
+    assert cached not in missing_keys
+    assert len(missing_keys) == len(manifest.keys()) - 1
+    manifest.close()
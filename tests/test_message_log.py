@@ -0,0 +1,41 @@
+""" Tests for the buffered message log """
+import gzip
+from message_log import MessageLog
+
+
+def test_message_log_rotates_and_compresses(tmp_path):
+    """ Ensure lines are written to per game segments and closed segments are compressed """
+    message_log = MessageLog(directory=str(tmp_path), flush_interval=0.01)
+    message_log.write('MESSAGE: before game\n')
+    message_log.rotate('2018-02-25-game-3701')
+    message_log.write('MESSAGE: question\n')
+    message_log.close()
+    with gzip.open(str(tmp_path / 'messages.log.gz'), 'rt') as file:
+        assert file.read() == 'MESSAGE: before game\n'
+    with gzip.open(str(tmp_path / '2018-02-25-game-3701.log.gz'), 'rt') as file:
+        assert file.read() == 'MESSAGE: question\n'
+    assert message_log.flushed == 2
+    assert message_log.dropped == 0
+
+
+def test_message_log_drops_when_full(tmp_path):
+    """ Ensure writing never blocks and counts dropped lines when the queue is full """
+    message_log = MessageLog(directory=str(tmp_path), max_pending=1, flush_interval=60)
+    message_log.rotate('game')
+    for _ in range(1000):
+        message_log.write('MESSAGE: chat\n')
+    message_log.close()
+    assert message_log.dropped > 0
+    assert message_log.flushed + message_log.dropped == 1000
+
+
+def test_message_log_commands_never_block(tmp_path):
+    """ Ensure rotating and closing a full log never block the caller, and no line is written to the wrong game """
+    message_log = MessageLog(directory=str(tmp_path), max_pending=1, flush_interval=60)
+    message_log.write('MESSAGE: first\n')
+    for game in range(100):
+        message_log.rotate('game-%s' % game)
+    message_log.close()
+    with gzip.open(str(tmp_path / 'messages.log.gz'), 'rt') as file:
+        assert file.read() == 'MESSAGE: first\n'
+    assert message_log.segment == 'game-99'
@@ -0,0 +1,117 @@
+""" Tests for the concurrent cache refresh against a local stand-in search server """
+from json import load
+from threading import Thread, Lock
+from unittest.mock import Mock
+from http.server import BaseHTTPRequestHandler
+import pytest
+from requests import Session
+from refresh import Refresher, TokenBucket
+from tests.test_session import ThreadedHTTPServer
+
+
+class RateLimitingHandler(BaseHTTPRequestHandler):
+    """ Search page that redirects to the rate limit page while the server has limited requests left """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Redirect to the rate limit page or respond with a tiny body """
+        with self.server.lock:
+            limited = self.path.startswith('/search') and self.server.limited > 0
+            self.server.limited -= 1 if limited else 0
+        if limited:
+            self.send_response(302)
+            self.send_header('Location', '/sorry/index?continue=%s' % self.path)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.server.paths.append(self.path)
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def search_server():
+    """ Run a local search server that starts with no rate limited requests """
+    httpd = ThreadedHTTPServer(('127.0.0.1', 0), RateLimitingHandler)
+    (httpd.limited, httpd.paths, httpd.lock) = (0, [], Lock())
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def cached_session():
+    """ Session standing in for a cached session """
+    session = Session()
+    session.cache = Mock()
+    return session
+
+
+def search_urls(httpd, count):
+    """ URLs of search pages on the local server """
+    return ['http://127.0.0.1:%s/search?q=%s' % (httpd.server_port, i) for i in range(count)]
+
+
+def test_token_bucket_rate():
+    """ Ensure the bucket lets requests through at its rate after the initial burst """
+    bucket = TokenBucket(rate=50, burst=2)
+    stop = Mock(wait=Mock(return_value=False))
+    for _ in range(4):
+        assert bucket.acquire(stop)
+    waits = [call[0][0] for call in stop.wait.call_args_list]
+    assert waits and all(0 < wait <= 0.02 for wait in waits)
+
+
+def test_refresh_backs_off_when_rate_limited(search_server, tmp_path): # pylint: disable=redefined-outer-name
+    """ Ensure rate limited URLs are deleted from the cache and fetched again after backing off """
+    search_server.limited = 2
+    urls = search_urls(search_server, 10)
+    session = cached_session()
+    refresher = Refresher(session, rate=200, workers=3, backoff=0.05,
+                          checkpoint_path=str(tmp_path / 'refresh.json'), checkpoint_every=2)
+    assert refresher.run(urls)
+    assert refresher.fetched == 10
+    assert refresher.rate_limits == 2
+    assert session.cache.delete_url.call_count == 2
+    searched = sorted(path for path in search_server.paths if path.startswith('/search'))
+    assert searched == sorted(url[url.index('/search'):] for url in urls)
+    assert not (tmp_path / 'refresh.json').exists()
+
+
+def test_refresh_resumes_from_checkpoint(search_server, tmp_path): # pylint: disable=redefined-outer-name
+    """ Ensure a refresh that stops saves its pending URLs and a later refresh fetches them first """
+    search_server.limited = 1000
+    urls = search_urls(search_server, 6)
+    checkpoint_path = str(tmp_path / 'refresh.json')
+    refresher = Refresher(cached_session(), rate=200, workers=2, backoff=0.01, max_rate_limits=2,
+                          checkpoint_path=checkpoint_path)
+    assert not refresher.run(urls[3:])
+    with open(checkpoint_path) as file:
+        assert sorted(load(file)['pending']) == urls[3:]
+
+    (search_server.limited, search_server.paths) = (0, [])
+    refresher = Refresher(cached_session(), rate=200, workers=1, checkpoint_path=checkpoint_path)
+    assert sorted(refresher.resume(urls)[:3]) == urls[3:]
+    assert refresher.run(urls)
+    assert refresher.fetched == 6
+    assert search_server.paths[0] in [url[url.index('/search'):] for url in urls[3:]]
+
+
+def test_refresh_keeps_failed_urls(search_server, tmp_path): # pylint: disable=redefined-outer-name
+    """ Ensure URLs whose requests fail are kept in the checkpoint and fetched first by the next refresh """
+    urls = search_urls(search_server, 3)
+    failing = 'http://127.0.0.1:1/search?q=refused'
+    checkpoint_path = str(tmp_path / 'refresh.json')
+    refresher = Refresher(cached_session(), rate=200, workers=2, checkpoint_path=checkpoint_path)
+    assert not refresher.run(urls + [failing])
+    assert refresher.fetched == 3
+    assert refresher.failed == [failing]
+    with open(checkpoint_path) as file:
+        assert load(file)['pending'] == [failing]
+    refresher = Refresher(cached_session(), rate=200, workers=2, checkpoint_path=checkpoint_path)
+    assert refresher.resume(urls + [failing])[0] == failing
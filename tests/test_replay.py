@@ -1,6 +1,6 @@
 """ Tests for the Replayer class and its methods """
 from unittest.mock import mock_open, patch, ANY
-from json import loads
+from json import load, loads
 import pytest
 from tests.utils import generate_game, generate_question
 import replay
@@ -9,7 +9,8 @@ import replay
 @pytest.mark.parametrize("globbed_paths, game_json", [
     ([], None), # no game in game folder, no json to return
     (['games/json/2018-02-25-game-3701'], generate_game(as_json=True)), # one game file, mock json
-    (['games/json/2018-02-25-game-3701', 'games/json/2018-02-26-game-3702'], generate_game(as_json=True)), # two games, mock json
+    # two games, mock json
+    (['games/json/2018-02-25-game-3701', 'games/json/2018-02-26-game-3702'], generate_game(as_json=True)),
 ])
 def test_load_questions(globbed_paths, game_json, monkeypatch):
     """ Ensure a Replay.load_question method will read correctly from the
@@ -115,3 +116,55 @@ def test_gen_report_six_replays(mock_webbrowser, mock_data_frame, monkeypatch):
     assert mock_data_frame.call_args[1]['data'][5].count(0) == 70
     # ensure dataframe converted to table
     assert  mock_data_frame.return_value.to_html.called
+
+
+def test_parallel_play_matches_serial(tmp_path, monkeypatch):
+    """ Ensure a replay on worker processes saves the same results, in the same order, as a serial replay """
+    def fake_prediction_time(_bot, question):
+        """ Predict from the question id and print it """
+        print('Predicting %s' % question.id)
+        question.add_prediction('ABC'[question.id % 3], {'A': '0%', 'B': '0%', 'C': '0%'})
+
+    (tmp_path / 'games' / 'db').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(replay.HqTriviaBot, 'prediction_time', fake_prediction_time)
+    questions = [generate_question(is_replay=True) for _ in range(10)]
+    for index, question in enumerate(questions):
+        question.id = index
+    monkeypatch.setattr(replay.Replayer, 'load_questions', staticmethod(lambda: questions))
+    replay.Replayer().play()
+    replay.Replayer().play(workers=3)
+    with open('replay_results.json') as file:
+        (serial, parallel) = load(file)
+    assert [saved['questionId'] for saved in serial] == list(range(10))
+    assert parallel == serial
+
+
+def test_parallel_play_predicts_missing_pages_in_parent(tmp_path, monkeypatch):
+    """ Ensure questions whose pages are not cached are predicted by the parent, which may fetch them """
+    def fake_prediction_time(trivia_bot, question):
+        """ Fail in workers, which only read the cache, for every third question """
+        if trivia_bot.features is not None and not trivia_bot.features.fetch and question.id % 3 == 0:
+            raise replay.PageMissing('https://search/%s' % question.id)
+        question.add_prediction('A', {'A': '0%', 'B': '0%', 'C': '0%'})
+
+    (tmp_path / 'games' / 'db').mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(replay.HqTriviaBot, 'prediction_time', fake_prediction_time)
+    questions = [generate_question(is_replay=True) for _ in range(7)]
+    for index, question in enumerate(questions):
+        question.id = index
+    monkeypatch.setattr(replay.Replayer, 'load_questions', staticmethod(lambda: questions))
+    replay.Replayer().play(workers=2)
+    with open('replay_results.json') as file:
+        (results,) = load(file)
+    assert [saved['questionId'] for saved in results] == list(range(7))
+
+
+def test_save_results_skips_unsaved(tmp_path, monkeypatch):
+    """ Ensure questions that saved nothing are left out of the replay results """
+    monkeypatch.chdir(tmp_path)
+    replay.Replayer.setup_output_file()
+    replay.Replayer.save_results([None, {'questionId': 1}])
+    with open('replay_results.json') as file:
+        assert load(file) == [[{'questionId': 1}]]
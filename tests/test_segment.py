@@ -0,0 +1,54 @@
+""" Tests for compressed cache segments """
+import gzip
+from sqlite3 import connect
+import pytest
+from cache import Cache
+from segment import read_segment, write_segment
+
+
+def test_segment_round_trip(tmp_path):
+    """ Ensure keys and values of every type are read back as written """
+    rows = [('urls', "key'with\"quotes", 'response key'),
+            ('responses', 'response key', b'\x00pickled\n'),
+            ('responses', 'empty', None),
+            ('urls', 12, 1538000000.25)]
+    filename = str(tmp_path / 'show.seg.gz')
+    assert write_segment(filename, rows) == 4
+    assert list(read_segment(filename)) == rows
+
+
+def test_segment_rejects_other_files(tmp_path):
+    """ Ensure files without the segment header are not imported """
+    filename = tmp_path / 'show.seg.gz'
+    filename.write_bytes(gzip.compress(b'not a segment'))
+    with pytest.raises(ValueError):
+        list(read_segment(str(filename)))
+
+
+def test_export_and_import_formats(tmp_path):
+    """ Ensure a show exported as a segment or as SQL imports the same rows """
+    db_path = str(tmp_path / 'cache.sqlite')
+    conn = connect(db_path)
+    conn.executescript("""
+        create table urls (key PRIMARY KEY, value);
+        create table responses (key PRIMARY KEY, value);
+        create table manifest (game text, question_id integer, solver text, answer text, url text, key text);
+        insert into manifest values ('show', 1, 'Solver', 'A', 'https://search/a', 'a''key');
+        insert into manifest values ('other', 2, 'Solver', 'A', 'https://search/b', 'b');
+        insert into urls values ('a''key', 'a''key');
+        insert into responses values ('a''key', x'00ff');
+        insert into responses values ('b', x'01');
+    """)
+    (tmp_path / 'segment').mkdir()
+    (tmp_path / 'sql').mkdir()
+    assert Cache.export_segment(conn, 'show', str(tmp_path / 'segment' / 'show.seg.gz')) == 2
+    conn.close()
+    Cache.export_sql('show', str(tmp_path / 'sql' / 'show.sql'), db_path)
+
+    for name in ['segment', 'sql']:
+        imported_path = str(tmp_path / ('%s.sqlite' % name))
+        Cache.import_sql(imported_path, str(tmp_path / name))
+        imported = connect(imported_path)
+        assert list(imported.execute('select * from urls')) == [("a'key", "a'key")]
+        assert list(imported.execute('select * from responses')) == [("a'key", b'\x00\xff')]
+        imported.close()
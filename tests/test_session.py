@@ -0,0 +1,100 @@
+""" Tests for the pooled search session """
+from threading import Thread
+from unittest.mock import Mock, patch
+from concurrent.futures import Future
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+from session import SearchSession, RequestRegistry, iter_completed
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    """ HTTP server handling each keep-alive connection in its own thread """
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """ Minimal HTTP/1.1 handler that keeps connections open """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """ Respond with a tiny body """
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_HEAD(self): # pylint: disable=invalid-name
+        """ Respond with headers only """
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args): # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def local_url():
+    """ Run a local keep-alive HTTP server for the duration of a test """
+    httpd = ThreadedHTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%s/search?q={}' % httpd.server_port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_warm_up_reuses_connections(local_url): # pylint: disable=redefined-outer-name
+    """ Ensure requests after warm up reuse pooled connections without new handshakes """
+    session = SearchSession(max_workers=4)
+    assert session.warm_up([local_url], connections=2) == 2
+    (handshakes, _) = session.stats.snapshot()
+    assert 1 <= handshakes <= 2
+
+    session.get(local_url.format('query')).result()
+    assert session.stats.snapshot()[0] == handshakes
+
+
+def test_iter_completed_order():
+    """ Ensure completed responses are yielded before futures still in flight """
+    slow, fast = Future(), Future()
+    fast.set_result('fast response')
+    results = iter_completed({slow: 'slow', fast: 'fast', 'cached response': 'cached'})
+    assert next(results) == ('cached response', 'cached')
+    assert next(results) == ('fast response', 'fast')
+    slow.set_result('slow response')
+    assert next(results) == ('slow response', 'slow')
+
+
+def test_iter_completed_failed_future():
+    """ Ensure a failed request yields its error without ending the iteration """
+    failed, done = Future(), Future()
+    failed.set_exception(ConnectionError('refused'))
+    done.set_result('response')
+    results = dict((item, response) for response, item in iter_completed({failed: 'failed', done: 'done'}))
+    assert isinstance(results['failed'], ConnectionError)
+    assert results['done'] == 'response'
+
+
+def test_session_timeout(local_url): # pylint: disable=redefined-outer-name
+    """ Ensure requests are sent with the session timeout unless given their own """
+    session = SearchSession(max_workers=2, timeout=0.5)
+    with patch('requests.Session.request', return_value='response') as request:
+        session.get(local_url.format('query')).result()
+        session.get(local_url.format('query'), timeout=2).result()
+    assert [call[1]['timeout'] for call in request.call_args_list] == [0.5, 2]
+
+
+def test_registry_single_flight():
+    """ Ensure identical URLs are fetched once and share the same response """
+    session = Mock()
+    session.get.side_effect = lambda url: Mock(url=url)
+    registry = RequestRegistry(session)
+    first = registry.get('https://www.google.co.uk/search?pws=0&q=query')
+    second = registry.get('https://www.google.co.uk/search?pws=0&q=query')
+    other = registry.get('https://www.google.co.uk/search?pws=0&q=other')
+    assert first is second
+    assert other is not first
+    assert session.get.call_count == 2
+    assert registry.shared == 1
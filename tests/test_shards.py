@@ -0,0 +1,88 @@
+""" Tests for the monthly shards of the response cache """
+import os
+from sqlite3 import connect
+from cache import Cache
+from cache_reader import CacheReader
+from manifest import Manifest
+from segment import read_segment
+from shards import ShardedCache
+
+GAMES = ['2018-01-05-game-1', '2018-02-25-game-2', '2018-03-01-game-3']
+
+
+def cache_db(tmp_path, response_size=20000):
+    """ Main cache with one response per game and a redirect for the first """
+    db_path = str(tmp_path / 'cache.sqlite')
+    conn = connect(db_path)
+    conn.executescript('''
+        create table urls (key PRIMARY KEY, value);
+        create table responses (key PRIMARY KEY, value);
+        create table manifest (game text, question_id integer, solver text, answer text, url text, key text);
+        insert into urls values ('redirected', 'key0');
+    ''')
+    for index, game in enumerate(GAMES):
+        conn.execute('insert into manifest values (?, 1, ?, ?, ?, ?)', (game, 'Solver', 'A', 'url%s' % index,
+                                                                        'key%s' % index))
+        conn.execute('insert into responses values (?, ?)', ('key%s' % index, b'\x00' * response_size))
+    conn.execute("insert into responses values ('unsaved', x'00')")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_split_moves_saved_responses_to_month_shards(tmp_path):
+    """ Ensure responses for saved games move to their month shard and still count as cached """
+    db_path = cache_db(tmp_path)
+    sharded = ShardedCache(db_path, str(tmp_path / 'shards'))
+    assert sharded.split() == 3
+    assert sharded.split() == 0
+    assert sorted(month for (month, _) in sharded.shards()) == [
+        '2018-01', '2018-02', '2018-03'
+    ]
+    assert list(sharded.conn.execute('select key from responses')) == [('unsaved',)]
+    sharded.close()
+    manifest = Manifest(db_path, str(tmp_path / '*.json'))
+    assert manifest.missing() == []
+    manifest.close()
+
+    reader = CacheReader(db_path)
+    assert reader.lookup(reader.attach('2018-01'), 'redirected') == (b'\x00' * 20000,)
+    assert reader.lookup('main', 'key1') is None
+    reader.close()
+
+    conn = connect(db_path)
+    conn.execute('attach database ? as shard', (str(tmp_path / 'shards' / '2018-01.sqlite'),))
+    Cache.export_segment(conn, GAMES[0], str(tmp_path / 'game.seg.gz'), ['main', 'shard'])
+    conn.close()
+    assert [(table, key) for (table, key, _) in read_segment(str(tmp_path / 'game.seg.gz'))] == [
+        ('urls', 'redirected'), ('responses', 'key0')
+    ]
+
+
+def test_evict_to_size_cap(tmp_path):
+    """ Ensure whole shards are deleted, least recently used first, until the cache fits its cap """
+    db_path = cache_db(tmp_path)
+    sharded = ShardedCache(db_path, str(tmp_path / 'shards'))
+    sharded.split()
+    for index, (_, path) in enumerate(sorted(sharded.shards())):
+        os.utime(path, (1000 - index, 1000 - index))
+    sharded.max_bytes = sharded.size() - 1
+    assert sharded.evict() == ['2018-03']
+    sharded.eviction = 'age'
+    sharded.max_bytes = 0
+    assert sharded.evict() == ['2018-01', '2018-02']
+    assert sharded.conn.execute('select count(*) from shard_keys').fetchone() == (0,)
+    sharded.close()
+
+
+def test_split_shrinks_main_cache(tmp_path):
+    """ Ensure moving responses out gives their pages back, so a cache under its cap is not evicted """
+    db_path = cache_db(tmp_path, response_size=500000)
+    unsplit_size = os.path.getsize(db_path)
+    sharded = ShardedCache(db_path, str(tmp_path / 'shards'), max_bytes=int(unsplit_size * 1.1))
+    sharded.split()
+    assert os.path.getsize(db_path) < unsplit_size / 10
+    assert sharded.size() <= sharded.max_bytes
+    assert sharded.evict() == []
+    assert len(sharded.shards()) == 3
+    sharded.close()
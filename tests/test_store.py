@@ -0,0 +1,67 @@
+""" Tests for the in-memory game store """
+from json import load, loads
+from tests.utils import generate_question
+from store import GameStore
+
+
+def game_status():
+    """ Example gameStatus message """
+    return {'type': 'gameStatus', 'showId': 3701, 'ts': '2018-02-25T20:56:38.861Z',
+            'prize': '$6500', 'questionCount': 12}
+
+
+def test_store_compacts_journal(tmp_path):
+    """ Ensure saved questions are held in memory and compacted into the game file on close """
+    game_path = str(tmp_path / 'game.json')
+    store = GameStore.open(game_path, game_status(), str(tmp_path / 'game.jsonl'))
+    question = generate_question()
+    question.store = store
+    question.add_prediction('B', {'A': '0%', 'B': '100%', 'C': '0%'})
+    question.add_correct('B')
+    assert store.get(question.id).correct == 'B'
+    store.close()
+    with open(game_path) as file:
+        saved = load(file)
+    assert saved['showId'] == 3701
+    assert len(saved['questions']) == 1
+    assert saved['questions'][0]['correct'] == 'B'
+    assert 'store' not in saved['questions'][0]
+    assert not (tmp_path / 'game.json.tmp').exists()
+    assert not (tmp_path / 'game.jsonl').exists()
+
+
+def test_store_reopens_saved_game(tmp_path):
+    """ Ensure a store for a game already saved loads its questions """
+    game_path = str(tmp_path / 'game.json')
+    store = GameStore.open(game_path, game_status(), str(tmp_path / 'game.jsonl'))
+    store.save(generate_question()._dict_for_json()) # pylint: disable=protected-access
+    store.close()
+    reopened = GameStore.open(game_path, game_status(), str(tmp_path / 'game.jsonl'))
+    assert reopened.get(123).text == "This is a question, isn't it?"
+    assert reopened.get(456) is None
+    reopened.close()
+
+
+def test_store_recovers_from_journal(tmp_path):
+    """ Ensure a game is rebuilt from its journal after a crash, ignoring a partly written line """
+    game_path = str(tmp_path / 'game.json')
+    journal_path = tmp_path / 'game.jsonl'
+    store = GameStore.open(game_path, game_status(), str(journal_path))
+    question = generate_question()
+    question.store = store
+    question.add_prediction('C', {'A': '0%', 'B': '25%', 'C': '75%'})
+    question.add_correct('A')
+    store._events.put(None) # pylint: disable=protected-access
+    store._writer.join() # pylint: disable=protected-access
+    with open(str(journal_path), 'a') as file:
+        file.write('{"event": "correct", "da')
+
+    recovered = GameStore.open(game_path, game_status(), str(journal_path))
+    assert recovered.get(123).prediction['answer'] == 'C'
+    assert recovered.get(123).correct == 'A'
+    assert journal_path.read_text().endswith('\n')
+    events = [loads(line)['event'] for line in journal_path.read_text().splitlines()]
+    assert events == ['gameStatus', 'prediction', 'correct', 'question', 'correct']
+    recovered.close()
+    with open(game_path) as file:
+        assert load(file)['questions'][0]['correct'] == 'A'
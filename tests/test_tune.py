@@ -0,0 +1,43 @@
+""" Tests for the vectorised weight tuning """
+from random import Random
+import numpy as np
+from solvers import BaseSolver, GoogleAnswerWordsSolver, GoogleResultsCountSolver
+from tune import ANSWER_KEYS, evaluate
+
+
+def test_evaluate_matches_solver_rules():
+    """ Ensure vectorised accuracy matches compute_confidence and choose_answer for every weight combination """
+    random = Random(7)
+    questions = []
+    for index in range(60):
+        question = {
+            'exact': [random.choice([0, 0, 1, 2, 5]) for _ in ANSWER_KEYS],
+            'partial': [random.choice([0, 1, 3, 10]) for _ in ANSWER_KEYS],
+            'results': [random.choice([0, 7, 1000, 123456]) for _ in ANSWER_KEYS],
+            'text': 'Which of these is NOT a bird?' if index % 4 == 0 else 'Which is a bird?',
+            'correct': random.randrange(3),
+        }
+        questions.append(question)
+    counts = {name: np.array([question[name] for question in questions]) for name in ['exact', 'partial', 'results']}
+    counts['inverted'] = np.array([[' NOT ' in question['text']] for question in questions])
+    counts['correct'] = np.array([[question['correct']] for question in questions])
+    grid = {'words_weight': [0, 75, 200], 'count_weight': [0, 100, 333],
+            'full_answer_weight': [0, 1000], 'partial_answer_weight': [7, 100]}
+    accuracy = evaluate(counts, grid)
+
+    (words_solver, count_solver) = (GoogleAnswerWordsSolver(), GoogleResultsCountSolver())
+    for i, full in enumerate(grid['full_answer_weight']):
+        for j, partial in enumerate(grid['partial_answer_weight']):
+            for k, words_weight in enumerate(grid['words_weight']):
+                for m, count_weight in enumerate(grid['count_weight']):
+                    (words_solver.weight, count_solver.weight) = (words_weight, count_weight)
+                    correct = 0
+                    for question in questions:
+                        words = {key: full * question['exact'][n] + partial * question['partial'][n]
+                                 for n, key in enumerate(ANSWER_KEYS)}
+                        results = dict(zip(ANSWER_KEYS, question['results']))
+                        confidence = words_solver.compute_confidence(words, {'A': 0, 'B': 0, 'C': 0})
+                        confidence = count_solver.compute_confidence(results, confidence)
+                        answer = BaseSolver.choose_answer(question['text'], confidence)
+                        correct += answer == ANSWER_KEYS[question['correct']]
+                    assert accuracy[i, j, k, m] == correct / len(questions)
@@ -0,0 +1,28 @@
+""" Tests for utility functions """
+from random import Random
+import pytest
+from utils import PhraseCounter, get_raw_words
+
+
+@pytest.mark.parametrize("text, phrase", [
+    ('the cheetah is the fastest cheetah', 'cheetah'), # last word has no trailing space
+    ('cheetah cheetah cheetah cheetah x', 'cheetah'), # repeated words do not overlap
+    ('a  b  c', ''), # double spaces give empty words
+    ('land animal land animal land', 'land animal'),
+    ('', 'anything'),
+])
+def test_phrase_counter_count(text, phrase):
+    """ Ensure PhraseCounter counts match str.count on padded phrases """
+    assert PhraseCounter([phrase]).count_all(text)[phrase] == text.count(' {} '.format(phrase))
+
+
+def test_phrase_counter_random():
+    """ Ensure PhraseCounter counts every phrase in one pass the same as str.count """
+    random = Random(11)
+    vocabulary = ['a', 'b', 'c', 'and', '', 'cheetah']
+    for _ in range(500):
+        text = get_raw_words(' '.join(random.choice(vocabulary) for _ in range(random.randint(0, 30))))
+        phrases = [' '.join(random.choice(vocabulary) for _ in range(random.randint(1, 3))) for _ in range(6)]
+        counts = PhraseCounter(phrases).count_all(text)
+        for phrase in phrases:
+            assert counts[phrase] == text.count(' {} '.format(phrase))
@@ -0,0 +1,122 @@
+""" Tune solver weights over answer counts recorded from saved games """
+import os
+from io import StringIO
+from itertools import product
+from contextlib import redirect_stdout
+import numpy as np
+from features import FeatureCache
+from replay import Replayer
+from solvers import GoogleAnswerWordsSolver, GoogleResultsCountSolver, RateLimited
+from utils import Colours
+
+COUNTS_PATH = 'games/db/tuning.npz'
+ANSWER_KEYS = ['A', 'B', 'C']
+GRID = {
+    'words_weight': list(range(0, 501, 25)),
+    'count_weight': list(range(0, 501, 25)),
+    'full_answer_weight': [0, 100, 250, 500, 1000, 2000, 5000],
+    'partial_answer_weight': [0, 10, 50, 100, 200, 500, 1000],
+}
+
+
+def extract_counts(questions, features):
+    """ Unweighted exact, partial and results counts of each answer for questions with a known correct answer """
+    (words_solver, count_solver) = (GoogleAnswerWordsSolver(), GoogleResultsCountSolver())
+    counts = {'exact': [], 'partial': [], 'results': [], 'inverted': [], 'correct': []}
+    for question in questions:
+        if question.correct not in ANSWER_KEYS:
+            continue
+        (exact, partial, results) = ({key: 0 for key in ANSWER_KEYS} for _ in range(3))
+        with redirect_stdout(StringIO()):
+            for url in words_solver.build_urls(question.text, question.answers).values():
+                (found_exact, found_partial) = words_solver.count_answers(features.get(words_solver, url),
+                                                                         question.answers)
+                for key in ANSWER_KEYS:
+                    exact[key] += found_exact[key]
+                    partial[key] += found_partial[key]
+            try:
+                for answer_key, url in count_solver.build_urls(question.text, question.answers).items():
+                    results = count_solver.score(features.get(count_solver, url), answer_key, question.answers,
+                                                 results)
+            except RateLimited:
+                continue
+        counts['exact'].append([exact[key] for key in ANSWER_KEYS])
+        counts['partial'].append([partial[key] for key in ANSWER_KEYS])
+        counts['results'].append([results[key] for key in ANSWER_KEYS])
+        counts['inverted'].append(' NOT ' in question.text or ' NEVER ' in question.text)
+        counts['correct'].append(ANSWER_KEYS.index(question.correct))
+    return {name: np.array(values, dtype=bool if name == 'inverted' else np.int64).reshape(len(values), -1)
+            for name, values in counts.items()}
+
+
+def percentages(matches):
+    """ Each answer's share of a question's matches as a percentage, or zero if it has none """
+    total = matches.sum(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(total > 0, matches / total * 100, 0.0)
+
+
+def choose_answers(confidence, inverted):
+    """ Index of the chosen answer per question, as BaseSolver.choose_answer picks it """
+    choice = np.where(inverted, confidence.argmin(axis=-1), confidence.argmax(axis=-1))
+    return np.where(confidence.sum(axis=-1) == 0, 0, choice)
+
+
+def evaluate(counts, grid):
+    """ Accuracy of every combination of grid weights, indexed by full, partial, words and count weight """
+    words_weights = np.array(grid['words_weight'], dtype=float)[:, None, None, None]
+    count_weights = np.array(grid['count_weight'], dtype=float)[None, :, None, None]
+    count_confidence = np.trunc(percentages(counts['results'])[None, None] * count_weights)
+    (inverted, correct) = (counts['inverted'][:, 0], counts['correct'][:, 0])
+    accuracy = np.zeros((len(grid['full_answer_weight']), len(grid['partial_answer_weight']),
+                         len(grid['words_weight']), len(grid['count_weight'])))
+    for (i, full), (j, partial) in product(enumerate(grid['full_answer_weight']),
+                                           enumerate(grid['partial_answer_weight'])):
+        words = percentages(full * counts['exact'] + partial * counts['partial'])
+        confidence = np.trunc(words[None, None] * words_weights) + count_confidence
+        accuracy[i, j] = (choose_answers(confidence, inverted) == correct).mean(axis=-1)
+    return accuracy
+
+
+class Tuner(object):
+    """ Searches solver weights over answer counts extracted once from every saved question """
+
+    def __init__(self, counts_path=COUNTS_PATH):
+        self.counts_path = counts_path
+
+    def load_counts(self, extract=False):
+        """ Load saved answer counts, extracting them from the feature cache first if needed """
+        if extract or not os.path.isfile(self.counts_path):
+            questions = Replayer.load_questions()
+            print('Extracting answer counts for %s questions' % len(questions))
+            counts = extract_counts(questions, FeatureCache())
+            np.savez(self.counts_path, **counts)
+            return counts
+        with np.load(self.counts_path) as saved:
+            return {name: saved[name] for name in saved.files}
+
+    @staticmethod
+    def current():
+        """ Grid holding only the weights the solvers use now """
+        return {
+            'words_weight': [GoogleAnswerWordsSolver.weight],
+            'count_weight': [GoogleResultsCountSolver.weight],
+            'full_answer_weight': [GoogleAnswerWordsSolver.full_answer_weight],
+            'partial_answer_weight': [GoogleAnswerWordsSolver.partial_answer_weight],
+        }
+
+    def run(self, extract=False, top=10):
+        """ Report the most accurate weight combinations in the grid """
+        counts = self.load_counts(extract)
+        if not len(counts['correct']):
+            exit('Error: No saved questions with a correct answer found.')
+        accuracy = evaluate(counts, GRID)
+        names = ['full_answer_weight', 'partial_answer_weight', 'words_weight', 'count_weight']
+        print('Evaluated %s weight combinations over %s questions' % (accuracy.size, len(counts['correct'])))
+        print(Colours.BOLD.value + 'Current weights: %.1f%%' % (evaluate(counts, self.current()).item() * 100) +
+              Colours.ENDC.value)
+        for flat_index in np.argsort(-accuracy, axis=None, kind='stable')[:top]:
+            index = np.unravel_index(flat_index, accuracy.shape)
+            print('%5.1f%%  %s' % (accuracy[index] * 100, '  '.join(
+                '%s=%s' % (name, GRID[name][position]) for name, position in zip(names, index)
+            )))
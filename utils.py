@@ -1,6 +1,8 @@
 """ Utilities for the HQ Trivia bot project """
 import re
 from enum import Enum
+from functools import lru_cache
+from collections import deque
 from glob import glob
 from configparser import ConfigParser
 from json import JSONDecodeError
@@ -53,12 +55,25 @@ def make_it_rain_for_all(headers):
         pass
 
 
+@lru_cache(maxsize=1)
+def get_stopwords():
+    """ Returns NLTK's English stopwords, loaded once per process """
+    return frozenset(stopwords.words('english'))
+
+
 def get_significant_words(question_words):
     """ Returns a list of the words from the input string that are not in NLTK's stopwords """
-    our_stopwords = set(stopwords.words('english'))
+    our_stopwords = get_stopwords()
     return list(filter(lambda word: word not in our_stopwords, question_words.split(' ')))
 
 
+@lru_cache(maxsize=None)
+def get_answer_words(answer):
+    """ Returns the raw words and significant words of an answer, computed once per answer """
+    raw_words = get_raw_words(answer)
+    return raw_words, tuple(get_significant_words(raw_words))
+
+
 def get_raw_words(data):
     """ Extract raw words from data """
     data = re.sub(r'[^\w ]', '', data).replace(' and ', ' ').strip()
@@ -66,6 +81,67 @@ def get_raw_words(data):
     return words
 
 
+class PhraseCounter(object):
+    """ Aho-Corasick automaton over words, counting many normalised phrases in one pass.
+    Counts match str.count(' {} '.format(phrase)) on the text, so a match needs a word either side
+    and matches of the same phrase do not overlap """
+
+    def __init__(self, phrases):
+        self.phrases = list(dict.fromkeys(phrases))
+        self.lengths = [len(phrase.split(' ')) for phrase in self.phrases]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern, phrase in enumerate(self.phrases):
+            state = 0
+            for word in phrase.split(' '):
+                if word not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][word] = len(self.goto) - 1
+                state = self.goto[state][word]
+            self.output[state].append(pattern)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and word not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[next_state] = self.goto[fail].get(word, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def count_all(self, words):
+        """ Count every phrase in normalised text, returning a dict of phrase to count """
+        tokens = words.split(' ')
+        counts = [0] * len(self.phrases)
+        next_start = [1] * len(self.phrases)
+        state = 0
+        for end, token in enumerate(tokens[:-1]):
+            while state and token not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(token, 0)
+            for pattern in self.output[state]:
+                start = end - self.lengths[pattern] + 1
+                if start >= next_start[pattern]:
+                    counts[pattern] += 1
+                    next_start[pattern] = end + 2
+        return dict(zip(self.phrases, counts))
+
+
+@lru_cache(maxsize=128)
+def get_answers_counter(answers):
+    """ Returns a PhraseCounter for the exact and significant words of answers, built once per question """
+    phrases = []
+    for answer in answers:
+        (raw_words, significant_words) = get_answer_words(answer)
+        phrases.append(raw_words)
+        phrases.extend(significant_words)
+    return PhraseCounter(phrases)
+
+
 def generate_token(headers, number):
     """ Generate an auth token for number """
     unauth_headers = headers.copy()